@@ -0,0 +1,52 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+REQUEST_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+# Сколько запросов к API страница может выполнять одновременно
+MAX_PARALLEL = int(os.getenv("API_MAX_PARALLEL", "8"))
+
+# Одна сессия на процесс Streamlit: соединения к API переиспользуются (keep-alive)
+# между запросами и перезапусками скрипта. Токен передаётся в заголовках каждого
+# запроса, поэтому общая сессия не смешивает данные разных пользователей.
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL * 2)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix="api")
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def request(method, path, **kwargs):
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    return _session.request(method, f"{API_URL}{path}", **kwargs)
+
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+
+def put(path, **kwargs):
+    return request("PUT", path, **kwargs)
+
+
+def get_many(paths, headers=None):
+    # Параллельные GET-запросы: время ответа - самый медленный запрос, а не их сумма.
+    # Элемент paths - путь, пара (путь, params) или тройка (путь, params, заголовки запроса);
+    # ответы возвращаются в том же порядке
+    futures = []
+    for item in paths:
+        path, params, item_headers = (item + (None, None))[:3] if isinstance(item, tuple) else (item, None, None)
+        futures.append(_executor.submit(get, path, headers=item_headers or headers, params=params))
+    return [future.result() for future in futures]
@@ -1,14 +1,101 @@
-import streamlit as st
-import requests
+from time import monotonic
 
-API_URL = "http://localhost:8000"
+import streamlit as st
+import api_client as api
+
+# Время жизни закешированных ответов API (секунды) по префиксу пути;
+# используется самый длинный подходящий префикс
+CACHE_TTLS = {
+    "/users/me/": 300,
+    "/subjects/": 3600,
+    "/students/": 300,
+    "/tutors/": 60,
+    "/feedbacks/": 60,
+    "/lessons/": 30,
+}
+
+
+def _cache_store():
+    # Кеш хранится в сессии пользователя: Streamlit перезапускает скрипт при каждом
+    # действии, и без кеша каждый перезапуск повторял бы все запросы к API
+    if "api_cache" not in st.session_state:
+        st.session_state["api_cache"] = {}
+    return st.session_state["api_cache"]
+
+
+def _cache_ttl(path):
+    prefixes = [prefix for prefix in CACHE_TTLS if path.startswith(prefix)]
+    return CACHE_TTLS[max(prefixes, key=len)] if prefixes else 0
+
+
+def _cache_key(path, headers, params):
+    token = (headers or {}).get("Authorization")
+    return (token, path, tuple(sorted((params or {}).items())))
+
+
+def _cache_lookup(key):
+    # (свежий ответ или None, запись кеша, в том числе устаревшая)
+    entry = _cache_store().get(key)
+    if entry is None or entry[0] < monotonic():
+        return None, entry
+    return entry[1], entry
+
+
+def _revalidation_headers(headers, entry):
+    # Устаревшая запись с ETag перепроверяется условным запросом: если данные
+    # не менялись, сервер отвечает 304 без тела и без выполнения запроса к БД
+    etag = entry[1].headers.get("ETag") if entry is not None else None
+    if not etag:
+        return headers
+    return dict(headers or {}, **{"If-None-Match": etag})
+
+
+def _cache_save(key, entry, response):
+    if response.status_code == 304 and entry is not None:
+        response = entry[1]
+    ttl = _cache_ttl(key[1])
+    if ttl and response.status_code == 200:
+        _cache_store()[key] = (monotonic() + ttl, response)
+    return response
+
+
+def cached_get(path, headers=None, params=None):
+    key = _cache_key(path, headers, params)
+    response, entry = _cache_lookup(key)
+    if response is None:
+        response = api.get(path, headers=_revalidation_headers(headers, entry), params=params)
+        response = _cache_save(key, entry, response)
+    return response
+
+
+def cached_get_many(paths, headers=None):
+    # Как api.get_many, но запрашиваются только отсутствующие в кеше ответы
+    items = [item if isinstance(item, tuple) else (item, None) for item in paths]
+    keys = [_cache_key(path, headers, params) for path, params in items]
+    lookups = [_cache_lookup(key) for key in keys]
+    responses = [response for response, _ in lookups]
+    missing = [i for i, response in enumerate(responses) if response is None]
+    fetched = api.get_many(
+        [items[i] + (_revalidation_headers(headers, lookups[i][1]),) for i in missing],
+        headers=headers,
+    )
+    for i, response in zip(missing, fetched):
+        responses[i] = _cache_save(keys[i], lookups[i][1], response)
+    return responses
+
+
+def invalidate_cache(*prefixes):
+    # Вызывается после изменений, сделанных через интерфейс
+    store = _cache_store()
+    for key in [key for key in store if key[1].startswith(prefixes)]:
+        del store[key]
 
 def login():
     st.title("Вход")
     email = st.text_input("Email")
     password = st.text_input("Пароль", type="password")
     if st.button("Войти"):
-        response = requests.post(f"{API_URL}/token", data={"username": email, "password": password})
+        response = api.post("/token", data={"username": email, "password": password})
         if response.status_code == 200:
             data = response.json()
             st.session_state['access_token'] = data['access_token']
@@ -37,7 +124,7 @@ def register():
             "role_id": role_id
         }
 
-        response = requests.post(f"{API_URL}/users/", json=user_data)
+        response = api.post("/users/", json=user_data)
 
         if response.status_code == 200:
             st.success("Успешная регистрация! Теперь вы можете войти.")
@@ -45,8 +132,8 @@ def register():
             st.error("Ошибка регистрации пользователя.")
 
 def get_tutors(token):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{API_URL}/tutors/", headers=headers)
+    headers = api.auth_headers(token)
+    response = cached_get("/tutors/", headers=headers)
     if response.status_code == 200:
         return response.json()
     else:
@@ -86,8 +173,8 @@ def main():
             register()
     else:
         token = st.session_state['access_token']
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(f"{API_URL}/users/me/", headers=headers)
+        headers = api.auth_headers(token)
+        response = cached_get("/users/me/", headers=headers)
         if response.status_code == 200:
             user = response.json()
             st.title(f"Добро пожаловать, {user['first_name']}!")
@@ -108,8 +195,17 @@ def main():
         else:
             st.error("Не удалось получить данные пользователя")
             del st.session_state['access_token']
+            invalidate_cache("/")
             st.rerun()
 
+def fetch_subject_names(headers):
+    # Справочник предметов загружается целиком один раз (кеш на час),
+    # названия по subject_id определяются локально
+    response = cached_get("/subjects/", headers=headers)
+    if response.status_code != 200:
+        return {}
+    return {subject["subject_id"]: subject["subject_name"] for subject in response.json()}
+
 def admin_panel(headers):
     st.subheader("Функции администратора")
     st.write("Функции пока не реализованы.")
@@ -134,29 +230,59 @@ def tutor_panel(headers):
         st.subheader("Добавить новое занятие")
 
         student_id = st.text_input("ID ученика")
-        subject_id = st.text_input("ID предмета")
+        subject_names = fetch_subject_names(headers)
+        subject_id = st.selectbox(
+            "Предмет",
+            options=list(subject_names),
+            format_func=lambda value: subject_names[value],
+        )
         lesson_date = st.date_input("Дата занятия")
         lesson_time = st.time_input("Время занятия")
+        repeat_weekly = st.checkbox("Повторять еженедельно")
+        if repeat_weekly:
+            end_date = st.date_input("Повторять до", value=lesson_date)
 
         if st.button("Добавить"):
-            lesson_data = {
-                "tutor_id": tutor_id,
-                "student_id": int(student_id),
-                "subject_id": int(subject_id),
-                "lesson_date": str(lesson_date),
-                "lesson_time": str(lesson_time),
-                "status": "scheduled",
-            }
-            response = requests.post(f"{API_URL}/lessons/", headers=headers, json=lesson_data)
-            if response.status_code == 200:
-                st.success("Занятие успешно добавлено!")
+            if repeat_weekly:
+                # Вся серия создаётся одним запросом на сервере
+                bulk_data = {
+                    "recurrence": {
+                        "tutor_id": tutor_id,
+                        "student_id": int(student_id),
+                        "subject_id": subject_id,
+                        "weekday": lesson_date.weekday(),
+                        "lesson_time": str(lesson_time),
+                        "start_date": str(lesson_date),
+                        "end_date": str(end_date),
+                        "status": "scheduled",
+                    }
+                }
+                response = api.post("/lessons/bulk", headers=headers, json=bulk_data)
+                if response.status_code == 200:
+                    invalidate_cache("/lessons/")
+                    st.success(f"Добавлено занятий: {len(response.json())}")
+                else:
+                    st.error("Ошибка при добавлении занятий.")
             else:
-                st.error("Ошибка при добавлении занятия.")
+                lesson_data = {
+                    "tutor_id": tutor_id,
+                    "student_id": int(student_id),
+                    "subject_id": subject_id,
+                    "lesson_date": str(lesson_date),
+                    "lesson_time": str(lesson_time),
+                    "status": "scheduled",
+                }
+                response = api.post("/lessons/", headers=headers, json=lesson_data)
+                if response.status_code == 200:
+                    invalidate_cache("/lessons/")
+                    st.success("Занятие успешно добавлено!")
+                else:
+                    st.error("Ошибка при добавлении занятия.")
         
     elif action == "Редактировать описание":
         st.subheader("Изменить описание и опыт работы")
 
-        response = requests.get(f"{API_URL}/tutors/{tutor_id}", headers=headers)
+        response = cached_get(f"/tutors/{tutor_id}", headers=headers)
         if response.status_code == 200:
             tutor_info = response.json()
             current_description = tutor_info["description"]
@@ -174,17 +300,18 @@ def tutor_panel(headers):
 
 
 def update_tutor_description(tutor_id, description, experience, token):
-    headers = {"Authorization": f"Bearer {token}"}
+    headers = api.auth_headers(token)
     data = {"description": description, "experience": experience}
-    response = requests.put(f"{API_URL}/tutors/{tutor_id}/description", json=data, headers=headers)
+    response = api.put(f"/tutors/{tutor_id}/description", json=data, headers=headers)
     if response.status_code == 200:
+        invalidate_cache("/tutors/")
         st.success("Информация успешно обновлена!")
     else:
         st.error(f"Ошибка при обновлении данных: {response.json()}")
 
 def fetch_schedule(tutor_id, token):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{API_URL}/lessons/tutor/{tutor_id}", headers=headers)
+    headers = api.auth_headers(token)
+    response = cached_get(f"/lessons/tutor/{tutor_id}/expanded", headers=headers)
     if response.status_code == 200:
         return response.json()
     else:
@@ -192,10 +319,11 @@ def fetch_schedule(tutor_id, token):
         return []
 
 def update_lesson_status(lesson_id, new_status, token):
-    headers = {"Authorization": f"Bearer {token}"}
+    headers = api.auth_headers(token)
     data = {"status": new_status}  
-    response = requests.put(f"{API_URL}/lessons/{lesson_id}/status", json=data, headers=headers)
+    response = api.put(f"/lessons/{lesson_id}/status", json=data, headers=headers)
     if response.status_code == 200:
+        invalidate_cache("/lessons/")
         st.success("Статус успешно обновлен!")
     else:
         st.error(f"Ошибка при обновлении статуса: {response.status_code}")
@@ -207,24 +335,11 @@ def display_schedule(schedule, token):
         st.info("Расписание пока пусто.")
         return
 
+    # Данные ученика и название предмета уже приходят в ответе /expanded
     for lesson in schedule:
-        student_details = fetch_student_details(lesson['student_id'], token)
-        if student_details:
-            student_name = f"{student_details['user']['first_name']} {student_details['user']['last_name']}"
-            education_level = student_details.get("education_level")
-        else:
-            student_name = "Неизвестный ученик"
-            education_level = "Неизвестно"
-
-        response = requests.get(
-            f"{API_URL}/subjects/{lesson['subject_id']}",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        if response.status_code == 200:
-            subject_details = response.json()
-            subject_name = subject_details.get("subject_name", "Неизвестный предмет")
-        else:
-            subject_name = "Неизвестный предмет"
+        student_name = f"{lesson['student_first_name']} {lesson['student_last_name']}"
+        education_level = lesson.get("education_level") or "Неизвестно"
+        subject_name = lesson["subject_name"]
 
         st.write(f"Дата: {lesson['lesson_date']}, Время: {lesson['lesson_time']}")
         st.write(f"Ученик: {student_name} (Уровень образования: {education_level})")
@@ -244,14 +359,6 @@ def display_schedule(schedule, token):
 
         st.write("---")
 
-def fetch_student_details(student_id, token):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{API_URL}/students/{student_id}", headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return None
-
 
 def student_panel(headers, user):
 
@@ -265,24 +372,36 @@ def student_panel(headers, user):
     if action == "Поиск репетиторов":
         st.subheader("Поиск репетиторов")
         st.info(f"Ваш ID: {student_id}")
-        response = requests.get(f"{API_URL}/tutors/", headers=headers)
-        if response.status_code == 200:
-            tutors = response.json()
-            for tutor in tutors:
-                st.write(f"Репетитор: {tutor['user']['first_name']} {tutor['user']['last_name']} (Рейтинг: {tutor['rating']})")
-                st.write(f"Описание: {tutor['description']}")
-                st.write(f"Email: {tutor['user']['email']}")
-                st.write(f"Опыт: {tutor['experience']} лет")
-
-                # Кнопка для просмотра отзывов
-                view_feedbacks(tutor['tutor_id'], headers["Authorization"].split(" ")[1])
-
-                # Форма для оставления отзыва
-                submit_feedback(tutor['tutor_id'], headers["Authorization"].split(" ")[1], student_id)
-
-                st.write("---")
-        else:
+        search_query = st.text_input("Имя, предмет или ключевые слова")
+        tutors, next_cursor = fetch_tutor_pages(search_query.strip(), headers)
+        if tutors is None:
             st.error("Не удалось загрузить список репетиторов")
+            return
+
+        token = headers["Authorization"].split(" ")[1]
+        # Занятия ученика загружаются не больше одного раза за отрисовку страницы
+        # и только если раскрыта хотя бы одна карточка
+        lessons_by_tutor = None
+        for tutor in tutors:
+            st.write(f"Репетитор: {tutor['user']['first_name']} {tutor['user']['last_name']} (Рейтинг: {tutor['rating']})")
+            st.write(f"Описание: {tutor['description']}")
+            st.write(f"Email: {tutor['user']['email']}")
+            st.write(f"Опыт: {tutor['experience']} лет")
+
+            # Отзывы и форма отзыва загружаются только для раскрытой карточки
+            if st.checkbox("Отзывы и оценка", key=f"expand_tutor_{tutor['tutor_id']}"):
+                view_feedbacks(tutor['tutor_id'], token)
+                if lessons_by_tutor is None:
+                    lessons_by_tutor = fetch_completed_lessons_by_tutor(student_id, headers)
+                submit_feedback(tutor['tutor_id'], token, student_id, lessons_by_tutor)
+
+            st.write("---")
+
+        if not tutors:
+            st.info("Репетиторы не найдены.")
+        elif next_cursor and st.button("Показать ещё", key="more_tutors"):
+            st.session_state["tutor_browse"]["cursors"].append(next_cursor)
+            st.rerun()
 
     elif action == "Моё расписание":
         st.subheader("Расписание")
@@ -293,7 +412,7 @@ def student_panel(headers, user):
     elif action == "Мой профиль":
         st.subheader("Ваш профиль")
         token = headers["Authorization"].split(" ")[1]
-        response = requests.get(f"{API_URL}/students/{student_id}", headers=headers)
+        response = cached_get(f"/students/{student_id}", headers=headers)
 
         if response.status_code == 200:
             student_data = response.json()
@@ -310,12 +429,13 @@ def student_panel(headers, user):
 
             if st.button("Обновить профиль"):
                 update_data = {"education_level": new_level}
-                update_response = requests.put(
-                    f"{API_URL}/students/{student_id}",
+                update_response = api.put(
+                    f"/students/{student_id}",
                     headers=headers,
                     json=update_data
                 )
                 if update_response.status_code == 200:
+                    invalidate_cache("/students/")
                     st.success("Уровень образования успешно обновлен!")
                 else:
                     st.error("Ошибка при обновлении данных.")
@@ -324,8 +444,8 @@ def student_panel(headers, user):
 
 
 def fetch_student_schedule(student_id, token):
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(f"{API_URL}/lessons/student/{student_id}", headers=headers)
+    headers = api.auth_headers(token)
+    response = cached_get(f"/lessons/student/{student_id}/expanded", headers=headers)
     if response.status_code == 200:
         schedule = response.json()
         return schedule
@@ -338,32 +458,10 @@ def display_student_schedule(schedule):
         st.info("Расписание пока пусто.")
         return
 
-    token = st.session_state.get("access_token")
-    if not token:
-        st.error("Отсутствует токен аутентификации.")
-        return
-    headers = {"Authorization": f"Bearer {token}"}
-
+    # Имена преподавателей и названия предметов уже приходят в ответе /expanded
     for lesson in schedule:
-        tutor_id = lesson["tutor_id"]
-
-
-        response = requests.get(
-            f"{API_URL}/subjects/{lesson['subject_id']}",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        if response.status_code == 200:
-            subject_details = response.json()
-            subject_name = subject_details.get("subject_name", "Неизвестный предмет")
-        else:
-            subject_name = "Неизвестный предмет"
-
-        tutor_response = requests.get(f"{API_URL}/tutors/{tutor_id}", headers=headers)
-        if tutor_response.status_code == 200:
-            tutor_data = tutor_response.json()
-            tutor_name = f"{tutor_data['user']['first_name']} {tutor_data['user']['last_name']}"
-        else:
-            tutor_name = "Неизвестный преподаватель"
+        tutor_name = f"{lesson['tutor_first_name']} {lesson['tutor_last_name']}"
+        subject_name = lesson["subject_name"]
 
         # Извлекаем данные о занятии
         date = lesson["lesson_date"]
@@ -381,7 +479,52 @@ def display_student_schedule(schedule):
 
 
 
-def submit_feedback(tutor_id, token, student_id):
+TUTORS_PAGE_SIZE = 20
+
+
+def fetch_tutor_pages(search_query, headers):
+    # Список репетиторов подгружается страницами по курсору сервера: в сессии хранятся
+    # курсоры уже открытых страниц, при смене запроса список начинается заново
+    browse = st.session_state.get("tutor_browse")
+    if browse is None or browse["query"] != search_query:
+        browse = {"query": search_query, "cursors": [None]}
+        st.session_state["tutor_browse"] = browse
+
+    if search_query:
+        path, params = "/tutors/search", {"q": search_query, "limit": TUTORS_PAGE_SIZE}
+    else:
+        path, params = "/tutors/", {"limit": TUTORS_PAGE_SIZE}
+    pages = [
+        (path, dict(params, cursor=cursor) if cursor else params)
+        for cursor in browse["cursors"]
+    ]
+
+    tutors = []
+    responses = cached_get_many(pages, headers=headers)
+    for response in responses:
+        if response.status_code != 200:
+            return None, None
+        tutors.extend(response.json())
+    return tutors, responses[-1].headers.get("X-Next-Cursor")
+
+
+def fetch_completed_lessons_by_tutor(student_id, headers):
+    # Завершённые занятия ученика, сгруппированные по репетитору; None при ошибке
+    lessons_by_tutor = {}
+    params = {"status": "completed", "limit": 500}
+    while True:
+        response = cached_get(f"/lessons/student/{student_id}", headers=headers, params=params)
+        if response.status_code != 200:
+            return None
+        for lesson in response.json():
+            lessons_by_tutor.setdefault(lesson["tutor_id"], []).append(lesson)
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            return lessons_by_tutor
+        params = dict(params, cursor=next_cursor)
+
+
+def submit_feedback(tutor_id, token, student_id, lessons_by_tutor):
     st.subheader(f"Оставить отзыв для преподавателя")
 
     # Инициализация состояния для отображения формы
@@ -396,37 +539,21 @@ def submit_feedback(tutor_id, token, student_id):
     if not st.session_state[f"show_feedback_form_{tutor_id}"]:
         return
 
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # Получение списка уроков между студентом и преподавателем
-    lessons_url = f"{API_URL}/lessons/student/{student_id}"
-    lessons_response = requests.get(lessons_url, headers=headers)
+    headers = api.auth_headers(token)
 
-    if lessons_response.status_code == 200:
-        lessons = lessons_response.json()
-        tutor_lessons = [
-            lesson for lesson in lessons if lesson["tutor_id"] == tutor_id
-        ]
-
-        if not tutor_lessons:
-            st.warning("Нет уроков с этим преподавателем, отзыв недоступен.")
-            return
-    else:
+    if lessons_by_tutor is None:
         st.error("Ошибка при получении уроков. Попробуйте позже.")
         return
 
-    lesson_choices = {}
+    tutor_lessons = lessons_by_tutor.get(tutor_id, [])
+    if not tutor_lessons:
+        st.warning("Нет завершённых уроков с этим преподавателем, отзыв недоступен.")
+        return
 
+    subject_names = fetch_subject_names(headers)
+    lesson_choices = {}
     for lesson in tutor_lessons:
-        response = requests.get(
-            f"{API_URL}/subjects/{lesson['subject_id']}",
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        if response.status_code == 200:
-            subject_details = response.json()
-            subject_name = subject_details.get("subject_name", "Неизвестный предмет")
-        else:
-            subject_name = "Неизвестный предмет"
+        subject_name = subject_names.get(lesson["subject_id"], "Неизвестный предмет")
         lesson_choices[f"{lesson['lesson_date']} {lesson['lesson_time']} - {subject_name}"] = lesson["lesson_id"]
 
     # Генерация формы для оставления отзыва
@@ -449,8 +576,10 @@ def submit_feedback(tutor_id, token, student_id):
                 "rating": rating,
                 "comment": comment,
             }
-            response = requests.post(f"{API_URL}/feedbacks/", headers=headers, json=feedback_data)
+            response = api.post("/feedbacks/", headers=headers, json=feedback_data)
             if response.status_code == 200:
+                # Отзыв меняет рейтинг и статистику репетитора
+                invalidate_cache("/feedbacks/", "/tutors/")
                 st.success("Отзыв успешно добавлен!")
                 st.session_state[f"show_feedback_form_{tutor_id}"] = False
             else:
@@ -458,6 +587,9 @@ def submit_feedback(tutor_id, token, student_id):
 
 
 
+REVIEWS_PAGE_SIZE = 20
+
+
 def view_feedbacks(tutor_id, token):
     # Инициализация состояния для отображения отзывов
     if f"show_reviews_{tutor_id}" not in st.session_state:
@@ -470,16 +602,47 @@ def view_feedbacks(tutor_id, token):
     if st.session_state[f"show_reviews_{tutor_id}"]:
         st.subheader(f"Отзывы о преподавателе")
 
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(f"{API_URL}/feedbacks/tutor/{tutor_id}", headers=headers)
+        headers = api.auth_headers(token)
+
+        # Открытые страницы отзывов хранятся как курсоры сервера: "Показать ещё"
+        # догружает следующую страницу, уже загруженные берутся из кеша
+        cursors_key = f"reviews_cursors_{tutor_id}"
+        if cursors_key not in st.session_state:
+            st.session_state[cursors_key] = [None]
+        path, params = f"/feedbacks/tutor/{tutor_id}", {"limit": REVIEWS_PAGE_SIZE}
+        pages = [
+            (path, dict(params, cursor=cursor) if cursor else params)
+            for cursor in st.session_state[cursors_key]
+        ]
 
-        if response.status_code == 200:
-            feedbacks = response.json()
+        # Сводка по отзывам и страницы отзывов загружаются параллельно
+        stats_response, *page_responses = cached_get_many(
+            [f"/tutors/{tutor_id}/feedback-stats"] + pages,
+            headers=headers,
+        )
+        if stats_response.status_code == 200:
+            stats = stats_response.json()
+            if stats["total_count"] == 0:
+                st.info("У этого преподавателя пока нет отзывов.")
+                return
+            st.write(f"Средняя оценка: {stats['average']} ⭐ (отзывов: {stats['total_count']})")
+            if stats["average_30d"] is not None:
+                st.write(f"За последние 30 дней: {stats['average_30d']} ⭐ (отзывов: {stats['count_30d']})")
+            for stars in range(5, 0, -1):
+                st.write(f"{stars} ⭐: {stats['histogram'][str(stars)]}")
+
+
+        if all(response.status_code == 200 for response in page_responses):
+            feedbacks = [feedback for response in page_responses for feedback in response.json()]
             if feedbacks:
                 for feedback in feedbacks:
                     st.write(f"Рейтинг: {feedback['rating']} ⭐")
                     st.write(f"Комментарий: {feedback['comment']}")
                     st.write("---")
+                next_cursor = page_responses[-1].headers.get("X-Next-Cursor")
+                if next_cursor and st.button("Показать ещё", key=f"more_reviews_{tutor_id}"):
+                    st.session_state[cursors_key].append(next_cursor)
+                    st.rerun()
             else:
                 st.info("У этого преподавателя пока нет отзывов.")
         else:
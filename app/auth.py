@@ -1,34 +1,58 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
 from .database import get_db
 from .utils import decode_access_token
-from jose import JWTError
 from .crud import get_current_user_from_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def _decode_token(token: str):
+    payload = decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
     try:
-        payload = decode_access_token(token)
         user_id_str: str = payload.get("sub")
         if user_id_str is None:
             raise credentials_exception
         user_id = int(user_id_str)
-    except (JWTError, ValueError):
+    except ValueError:
         raise credentials_exception
+    return payload, user_id
 
+async def _load_user(db: AsyncSession, user_id: int):
     user = await get_current_user_from_db(db, user_id)
     if not user:
         raise credentials_exception
-
     return user
 
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    payload, user_id = _decode_token(token)
+
+    # Токены со встроенными claims не требуют запроса в БД;
+    # старые токены без role_id проверяются по БД
+    if settings.auth_trusted_claims and "role_id" in payload:
+        return {
+            "user_id": user_id,
+            "role_id": payload["role_id"],
+            "tutor_id": payload.get("tutor_id"),
+            "student_id": payload.get("student_id"),
+        }
+
+    return await _load_user(db, user_id)
+
+async def get_current_user_fresh(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    # Для обработчиков, которым нужны актуальные данные пользователя из БД
+    _, user_id = _decode_token(token)
+    return await _load_user(db, user_id)
+
 async def get_current_admin_user(current_user: dict = Depends(get_current_user)):
     if current_user["role_id"] != 1:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
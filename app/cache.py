@@ -0,0 +1,133 @@
+import asyncio
+import time
+from collections import OrderedDict
+from .config import settings
+
+MISSING = object()
+
+
+class TTLCache:
+    # LRU-кеш с ограничением размера и временем жизни записей.
+    # Все операции синхронные и выполняются в потоке event loop, поэтому блокировки не нужны.
+    # generation увеличивается при каждой инвалидации: значение, прочитанное из БД
+    # до инвалидации, не попадёт в кеш после неё.
+
+    def __init__(self, name: str, ttl: float, maxsize: int):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1]) if isinstance(entry[1], dict) else entry[1]
+
+    def set(self, key, value, generation: int):
+        if not settings.cache_enabled or generation != self.generation:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class TableSnapshot:
+    # Полная копия небольшой редко меняющейся таблицы. Версия таблицы из table_versions
+    # проверяется не чаще раза в check_interval секунд, строки перечитываются
+    # только после её изменения.
+
+    def __init__(self, name: str, check_interval: float):
+        self.name = name
+        self.check_interval = check_interval
+        self.version = None
+        self.updated_at = None
+        self.rows = []
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self):
+        return self.version is not None and time.monotonic() - self.checked_at < self.check_interval
+
+    def mark_checked(self):
+        self.checked_at = time.monotonic()
+
+    def load(self, version: int, updated_at, rows: list):
+        self.version = version
+        self.updated_at = updated_at
+        self.rows = rows
+        self.reloads += 1
+
+    @property
+    def etag(self):
+        return f'"{self.name}-{self.version}"'
+
+    def stats(self):
+        return {"version": self.version, "size": len(self.rows), "reloads": self.reloads}
+
+
+users = TTLCache("users", settings.cache_user_ttl, settings.cache_max_entries)
+tutors = TTLCache("tutors", settings.cache_tutor_ttl, settings.cache_max_entries)
+students = TTLCache("students", settings.cache_student_ttl, settings.cache_max_entries)
+subjects = TTLCache("subjects", settings.cache_subject_ttl, settings.cache_max_entries)
+# user_id -> tutor_id / student_id: связь не меняется, поэтому кешируется только идентификатор
+tutor_ids_by_user = TTLCache("tutor_ids_by_user", settings.cache_tutor_ttl, settings.cache_max_entries)
+student_ids_by_user = TTLCache("student_ids_by_user", settings.cache_student_ttl, settings.cache_max_entries)
+
+ALL_CACHES = [users, tutors, students, subjects, tutor_ids_by_user, student_ids_by_user]
+
+# Кеши, собранные из строк таблицы. Когда в table_versions видна новая версия таблицы
+# (например, её изменил другой воркер), эти кеши очищаются
+TABLE_CACHES = {
+    "users": [users],
+    "tutors": [tutors],
+    "students": [students],
+    "subjects": [subjects],
+}
+_seen_versions = {}
+
+
+def observe_table_versions(versions: dict):
+    for table, (version, _) in versions.items():
+        if _seen_versions.get(table) != version:
+            _seen_versions[table] = version
+            for table_cache in TABLE_CACHES.get(table, []):
+                table_cache.clear()
+
+
+subject_catalog = TableSnapshot("subjects", settings.catalog_version_check_interval)
+
+ALL_SNAPSHOTS = [subject_catalog]
+
+
+def stats():
+    result = {c.name: c.stats() for c in ALL_CACHES}
+    result["snapshots"] = {s.name: s.stats() for s in ALL_SNAPSHOTS}
+    return result
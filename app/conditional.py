@@ -0,0 +1,51 @@
+from datetime import timezone
+from email.utils import format_datetime
+
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import get_db
+from . import cache, crud
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # Слабое сравнение (RFC 9110): W/"x" и "x" считаются совпадающими
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def conditional_get(*tables: str):
+    # Зависимость для эндпоинтов чтения. Версия ответа - счётчики table_versions
+    # таблиц, из которых он собирается; они читаются одним запросом по первичному ключу
+    # до основного запроса. Если у клиента та же версия, отвечаем 304 и обработчик не
+    # выполняется. Версии читаются раньше данных, поэтому ETag никогда не новее тела ответа.
+    async def dependency(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+        if not settings.conditional_get_enabled:
+            return
+        versions = await crud.get_table_versions(db, tables)
+        if len(versions) != len(tables):
+            # Счётчики не установлены (нет миграции 0011): без них версия не отслеживается
+            return
+        # Кеши в памяти процесса сбрасываются, если таблицу изменил другой воркер:
+        # иначе тело ответа могло бы оказаться старше отданного ETag
+        cache.observe_table_versions(versions)
+
+        etag = 'W/"' + "-".join(f"{table}.{versions[table][0]}" for table in tables) + '"'
+        last_modified = max(updated_at for _, updated_at in versions.values())
+        headers = {
+            "ETag": etag,
+            "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+        # If-Modified-Since не поддерживается: секундная точность Last-Modified не отличает
+        # изменение в ту же секунду, что и прошлый ответ. Last-Modified - только справочно
+        if etag_matches(request, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return Depends(dependency)
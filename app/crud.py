@@ -1,10 +1,32 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from .utils import get_password_hash
-from . import schemas
+from datetime import timedelta
+from typing import List
+from .utils import get_password_hash_async
+from . import cache, schemas
+
+UNIQUE_VIOLATION = "23505"
+EXCLUSION_VIOLATION = "23P01"
+
+def _sqlstate(error: IntegrityError):
+    return getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+
+def is_unique_violation(error: IntegrityError) -> bool:
+    return _sqlstate(error) == UNIQUE_VIOLATION
+
+def is_exclusion_violation(error: IntegrityError) -> bool:
+    # Нарушение EXCLUDE-ограничения: занятия пересекаются по времени
+    return _sqlstate(error) == EXCLUSION_VIOLATION
+
+LESSON_CONFLICT_DETAIL = "Время занятия пересекается с другим занятием преподавателя или ученика"
 
 async def get_user(db: AsyncSession, user_id: int):
+    cached = cache.users.get(user_id)
+    if cached is not cache.MISSING:
+        return cached
+    generation = cache.users.generation
     query = text("""
         SELECT user_id, first_name, last_name, email, phone, role_id, created_at
         FROM users
@@ -14,7 +36,7 @@ async def get_user(db: AsyncSession, user_id: int):
     result = await db.execute(query, {"user_id": user_id})
     row = result.fetchone()
     if row:
-        return {
+        user = {
             "user_id": row.user_id,
             "first_name": row.first_name,
             "last_name": row.last_name,
@@ -23,14 +45,18 @@ async def get_user(db: AsyncSession, user_id: int):
             "role_id": row.role_id,
             "created_at": row.created_at
         }
+        cache.users.set(user_id, user, generation)
+        return user
     return None
 
 async def get_user_by_email(db: AsyncSession, email: str):
     query = text("""
         SELECT u.user_id, u.first_name, u.last_name, u.email, u.phone, u.role_id, u.created_at,
-               a.auth_id, a.password_hash, a.salt
+               a.auth_id, a.password_hash, a.salt, t.tutor_id, s.student_id
         FROM users AS u
         LEFT JOIN authentication AS a ON a.user_id = u.user_id
+        LEFT JOIN tutors AS t ON t.user_id = u.user_id
+        LEFT JOIN students AS s ON s.user_id = u.user_id
         WHERE u.email = :email
         LIMIT 1;
     """)
@@ -45,6 +71,8 @@ async def get_user_by_email(db: AsyncSession, email: str):
             "phone": row.phone,
             "role_id": row.role_id,
             "created_at": row.created_at,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id,
             "auth": {
                 "auth_id": row.auth_id,
                 "password_hash": row.password_hash,
@@ -53,66 +81,63 @@ async def get_user_by_email(db: AsyncSession, email: str):
         }
     return None
 
-async def get_user_by_phone(db: AsyncSession, phone: str):
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await get_password_hash_async(user.password)
+
+    # Пользователь, аутентификация и профиль репетитора/ученика создаются
+    # одним запросом в одной транзакции
     query = text("""
+        WITH new_user AS (
+            INSERT INTO users (first_name, last_name, email, phone, role_id, created_at)
+            VALUES (:first_name, :last_name, :email, :phone, :role_id, NOW())
+            RETURNING user_id, first_name, last_name, email, phone, role_id, created_at
+        ),
+        new_auth AS (
+            INSERT INTO authentication (user_id, password_hash, salt)
+            SELECT user_id, :password_hash, 'not_used_with_bcrypt'
+            FROM new_user
+        ),
+        new_tutor AS (
+            INSERT INTO tutors (user_id, description, experience)
+            SELECT user_id, 'Описание не указано', 0
+            FROM new_user
+            WHERE role_id = 2
+            RETURNING tutor_id
+        ),
+        new_student AS (
+            INSERT INTO students (user_id, education_level, interests)
+            SELECT user_id, 'Beginner', ''
+            FROM new_user
+            WHERE role_id = 3
+            RETURNING student_id
+        )
         SELECT u.user_id, u.first_name, u.last_name, u.email, u.phone, u.role_id, u.created_at,
-               a.auth_id, a.password_hash, a.salt
-        FROM users AS u
-        LEFT JOIN authentication AS a ON a.user_id = u.user_id
-        WHERE u.phone = :phone
-        LIMIT 1;
+               (SELECT tutor_id FROM new_tutor) AS tutor_id,
+               (SELECT student_id FROM new_student) AS student_id
+        FROM new_user AS u;
     """)
-    result = await db.execute(query, {"phone": phone})
-    row = result.fetchone()
-    if row:
-        return {
-            "user_id": row.user_id,
-            "first_name": row.first_name,
-            "last_name": row.last_name,
-            "email": row.email,
-            "phone": row.phone,
-            "role_id": row.role_id,
-            "created_at": row.created_at,
-            "auth": {
-                "auth_id": row.auth_id,
-                "password_hash": row.password_hash,
-                "salt": row.salt
-            }
-        }
-    return None
-
-async def create_user(db: AsyncSession, user: schemas.UserCreate):
-    hashed_password = get_password_hash(user.password)
 
-    insert_user_query = text("""
-        INSERT INTO users (first_name, last_name, email, phone, role_id, created_at)
-        VALUES (:first_name, :last_name, :email, :phone, :role_id, NOW())
-        RETURNING user_id, first_name, last_name, email, phone, role_id, created_at;
-    """)
+    try:
+        result = await db.execute(query, {
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "phone": user.phone,
+            "role_id": user.role_id,
+            "password_hash": hashed_password
+        })
+        db_user = result.fetchone()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
+            raise HTTPException(status_code=400, detail="User with this email or phone already exists")
+        raise HTTPException(status_code=400, detail="Некорректные данные пользователя")
 
-    result_user = await db.execute(insert_user_query, {
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "email": user.email,
-        "phone": user.phone,
-        "role_id": user.role_id
-    })
-    db_user = result_user.fetchone()
     if not db_user:
         raise HTTPException(status_code=500, detail="Не удалось создать пользователя")
 
-    insert_auth_query = text("""
-        INSERT INTO authentication (user_id, password_hash, salt)
-        VALUES (:user_id, :password_hash, 'not_used_with_bcrypt')
-        RETURNING auth_id;
-    """)
-
-    await db.execute(insert_auth_query, {
-        "user_id": db_user.user_id,
-        "password_hash": hashed_password
-    })
-
-    await db.commit()
+    cache.users.invalidate(db_user.user_id)
 
     return {
         "user_id": db_user.user_id,
@@ -121,36 +146,42 @@ async def create_user(db: AsyncSession, user: schemas.UserCreate):
         "email": db_user.email,
         "phone": db_user.phone,
         "role_id": db_user.role_id,
-        "created_at": db_user.created_at
+        "created_at": db_user.created_at,
+        "tutor_id": db_user.tutor_id,
+        "student_id": db_user.student_id
     }
 
 async def get_current_user_from_db(db: AsyncSession, user_id: int):
-    return await get_user(db, user_id)
-
-async def create_tutor(db: AsyncSession, tutor: schemas.TutorCreate):
     query = text("""
-        INSERT INTO tutors (user_id, description, experience, rating)
-        VALUES (:user_id, :description, :experience, 0.00)
-        RETURNING tutor_id, user_id, description, experience, rating;
+        SELECT u.user_id, u.first_name, u.last_name, u.email, u.phone, u.role_id, u.created_at,
+               t.tutor_id, s.student_id
+        FROM users AS u
+        LEFT JOIN tutors AS t ON t.user_id = u.user_id
+        LEFT JOIN students AS s ON s.user_id = u.user_id
+        WHERE u.user_id = :user_id
+        LIMIT 1;
     """)
-    result = await db.execute(query, {
-        "user_id": tutor.user_id,
-        "description": tutor.description,
-        "experience": tutor.experience
-    })
+    result = await db.execute(query, {"user_id": user_id})
     row = result.fetchone()
-    await db.commit()
     if row:
         return {
-            "tutor_id": row.tutor_id,
             "user_id": row.user_id,
-            "description": row.description,
-            "experience": row.experience,
-            "rating": float(row.rating)
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "email": row.email,
+            "phone": row.phone,
+            "role_id": row.role_id,
+            "created_at": row.created_at,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id
         }
     return None
 
 async def get_tutor(db: AsyncSession, tutor_id: int):
+    cached = cache.tutors.get(tutor_id)
+    if cached is not cache.MISSING:
+        return cached
+    generation = cache.tutors.generation
     query = text("""
         SELECT tutor_id, user_id, description, experience, rating
         FROM tutors
@@ -160,56 +191,232 @@ async def get_tutor(db: AsyncSession, tutor_id: int):
     result = await db.execute(query, {"tutor_id": tutor_id})
     row = result.fetchone()
     if row:
-        return {
+        tutor = {
             "tutor_id": row.tutor_id,
             "user_id": row.user_id,
             "description": row.description,
             "experience": row.experience,
             "rating": float(row.rating)
         }
+        cache.tutors.set(tutor_id, tutor, generation)
+        return tutor
     return None
 
-async def get_tutors(db: AsyncSession):
-    query = text("""
-        SELECT tutor_id, user_id, description, experience, rating
-        FROM tutors;
+def _tutor_with_user(row):
+    # Строка tutors JOIN users -> структура TutorOut
+    return {
+        "tutor_id": row.tutor_id,
+        "user": {
+            "user_id": row.user_id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "email": row.email,
+            "phone": row.phone,
+            "role_id": row.role_id,
+            "tutor_id": None,
+            "student_id": None,
+        },
+        "description": row.description,
+        "experience": row.experience,
+        "rating": float(row.rating),
+    }
+
+TUTOR_SORT_COLUMNS = {
+    "rating": "t.rating",
+    "experience": "t.experience",
+}
+
+async def get_tutors_with_users(
+    db: AsyncSession,
+    sort_by: str = "rating",
+    after_value=None,
+    after_id: int = None,
+    limit: int = 50,
+):
+    # Один запрос вместо N+1: репетиторы вместе с данными пользователей,
+    # keyset-пагинация по (sort_column, tutor_id) в порядке убывания.
+    # Возвращает репетиторов и ключ последней строки: рейтинг в нём остаётся Decimal,
+    # чтобы курсор совпадал с DECIMAL(3,2) точно, а не через двоичное значение float
+    sort_column = TUTOR_SORT_COLUMNS[sort_by]
+    keyset_filter = ""
+    params = {"limit": limit}
+    if after_value is not None and after_id is not None:
+        keyset_filter = f"WHERE ({sort_column}, t.tutor_id) < (:after_value, :after_id)"
+        params["after_value"] = after_value
+        params["after_id"] = after_id
+
+    query = text(f"""
+        SELECT t.tutor_id, t.user_id, t.description, t.experience, t.rating,
+               u.first_name, u.last_name, u.email, u.phone, u.role_id
+        FROM tutors AS t
+        JOIN users AS u ON u.user_id = t.user_id
+        {keyset_filter}
+        ORDER BY {sort_column} DESC, t.tutor_id DESC
+        LIMIT :limit;
     """)
-    result = await db.execute(query)
+    result = await db.execute(query, params)
     rows = result.fetchall()
-    tutors = []
-    for row in rows:
-        tutors.append({
-            "tutor_id": row.tutor_id,
-            "user_id": row.user_id,
-            "description": row.description,
-            "experience": row.experience,
-            "rating": float(row.rating)
-        })
-    return tutors
+    last_key = (getattr(rows[-1], sort_by), rows[-1].tutor_id) if rows else None
+    return [_tutor_with_user(row) for row in rows], last_key
 
-async def create_student(db: AsyncSession, student: schemas.StudentCreate):
+async def get_available_tutors(db: AsyncSession, subject_id: int, period_start, period_end, limit: int = 50):
+    # Репетиторы по предмету, у которых слот доступности покрывает интервал
+    # и нет пересекающихся занятий (GiST-индекс по lesson_period)
     query = text("""
-        INSERT INTO students (user_id, education_level, interests)
-        VALUES (:user_id, :education_level, :interests)
-        RETURNING student_id, user_id, education_level, interests;
+        SELECT t.tutor_id, t.user_id, t.description, t.experience, t.rating,
+               u.first_name, u.last_name, u.email, u.phone, u.role_id
+        FROM tutor_subjects AS ts
+        JOIN tutors AS t ON t.tutor_id = ts.tutor_id
+        JOIN users AS u ON u.user_id = t.user_id
+        WHERE ts.subject_id = :subject_id
+          AND EXISTS (
+              SELECT 1
+              FROM tutor_availability AS a
+              WHERE a.tutor_id = ts.tutor_id
+                AND a.weekday = :weekday
+                AND a.start_time <= :start_time
+                AND a.end_time >= :end_time
+          )
+          AND NOT EXISTS (
+              SELECT 1
+              FROM lessons AS l
+              WHERE l.tutor_id = ts.tutor_id
+                AND l.status <> 'canceled'
+                AND l.lesson_period && tsrange(:period_start, :period_end)
+          )
+        ORDER BY t.rating DESC, t.tutor_id
+        LIMIT :limit;
     """)
     result = await db.execute(query, {
-        "user_id": student.user_id,
-        "education_level": student.education_level,
-        "interests": student.interests
+        "subject_id": subject_id,
+        "weekday": period_start.weekday(),
+        "start_time": period_start.time(),
+        "end_time": period_end.time(),
+        "period_start": period_start,
+        "period_end": period_end,
+        "limit": limit
     })
-    row = result.fetchone()
-    await db.commit()
-    if row:
-        return {
-            "student_id": row.student_id,
-            "user_id": row.user_id,
-            "education_level": row.education_level,
-            "interests": row.interests
+    rows = result.fetchall()
+    return [_tutor_with_user(row) for row in rows]
+
+async def get_top_tutors(db: AsyncSession, subject_id: int = None, limit: int = 10):
+    # Читается из материализованных представлений, без агрегации на каждый запрос
+    if subject_id is None:
+        query = text("""
+            SELECT lb.tutor_id, u.first_name, u.last_name, NULL AS subject_id,
+                   lb.overall_rank AS rank, lb.review_count, lb.completed_lessons, lb.bayesian_rating
+            FROM tutor_leaderboard AS lb
+            JOIN tutors AS t ON t.tutor_id = lb.tutor_id
+            JOIN users AS u ON u.user_id = t.user_id
+            ORDER BY lb.overall_rank, lb.tutor_id
+            LIMIT :limit;
+        """)
+        params = {"limit": limit}
+    else:
+        query = text("""
+            SELECT lb.tutor_id, u.first_name, u.last_name, lb.subject_id,
+                   lb.subject_rank AS rank, lb.review_count, lb.completed_lessons, lb.bayesian_rating
+            FROM tutor_subject_leaderboard AS lb
+            JOIN tutors AS t ON t.tutor_id = lb.tutor_id
+            JOIN users AS u ON u.user_id = t.user_id
+            WHERE lb.subject_id = :subject_id
+            ORDER BY lb.subject_rank, lb.tutor_id
+            LIMIT :limit;
+        """)
+        params = {"subject_id": subject_id, "limit": limit}
+    result = await db.execute(query, params)
+    rows = result.fetchall()
+    return [
+        {
+            "tutor_id": row.tutor_id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "subject_id": row.subject_id,
+            "rank": row.rank,
+            "review_count": row.review_count,
+            "completed_lessons": row.completed_lessons,
+            "bayesian_rating": float(row.bayesian_rating),
         }
-    return None
+        for row in rows
+    ]
+
+async def refresh_leaderboards(db: AsyncSession) -> bool:
+    result = await db.execute(text("SELECT refresh_tutor_leaderboards() AS refreshed;"))
+    refreshed = result.scalar()
+    await db.commit()
+    return refreshed
+
+async def search_tutors(db: AsyncSession, q: str, limit: int = 20, offset: int = 0):
+    # Полнотекстовый поиск (GIN по search_vector) с нечётким совпадением по триграммам
+    # для опечаток в именах и предметах; релевантность усиливается рейтингом
+    query = text("""
+        SELECT t.tutor_id, t.user_id, t.description, t.experience, t.rating,
+               u.first_name, u.last_name, u.email, u.phone, u.role_id
+        FROM tutors AS t
+        JOIN users AS u ON u.user_id = t.user_id
+        CROSS JOIN websearch_to_tsquery('russian', :q) AS query
+        WHERE t.search_vector @@ query
+           OR lower(:q) <% t.search_text
+        ORDER BY (ts_rank(t.search_vector, query) + 0.5 * word_similarity(lower(:q), t.search_text))
+                 * (1 + t.rating / 5) DESC,
+                 t.tutor_id
+        LIMIT :limit OFFSET :offset;
+    """)
+    result = await db.execute(query, {"q": q, "limit": limit, "offset": offset})
+    rows = result.fetchall()
+    return [_tutor_with_user(row) for row in rows]
+
+async def set_tutor_subjects(db: AsyncSession, tutor_id: int, subject_ids: List[int]):
+    query = text("""
+        WITH removed AS (
+            DELETE FROM tutor_subjects
+            WHERE tutor_id = :tutor_id AND subject_id <> ALL(CAST(:subject_ids AS INTEGER[]))
+        )
+        INSERT INTO tutor_subjects (tutor_id, subject_id)
+        SELECT CAST(:tutor_id AS INTEGER), unnest(CAST(:subject_ids AS INTEGER[]))
+        ON CONFLICT DO NOTHING;
+    """)
+    try:
+        await db.execute(query, {"tutor_id": tutor_id, "subject_ids": subject_ids})
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Репетитор или предмет не найден")
+    return {"tutor_id": tutor_id, "subject_ids": subject_ids}
+
+async def set_tutor_availability(db: AsyncSession, tutor_id: int, slots: List[schemas.AvailabilitySlot]):
+    delete_query = text("""
+        DELETE FROM tutor_availability
+        WHERE tutor_id = :tutor_id;
+    """)
+    insert_query = text("""
+        INSERT INTO tutor_availability (tutor_id, weekday, start_time, end_time)
+        SELECT CAST(:tutor_id AS INTEGER), *
+        FROM unnest(
+            CAST(:weekdays AS SMALLINT[]),
+            CAST(:start_times AS TIME[]),
+            CAST(:end_times AS TIME[])
+        );
+    """)
+    try:
+        await db.execute(delete_query, {"tutor_id": tutor_id})
+        await db.execute(insert_query, {
+            "tutor_id": tutor_id,
+            "weekdays": [slot.weekday for slot in slots],
+            "start_times": [slot.start_time for slot in slots],
+            "end_times": [slot.end_time for slot in slots]
+        })
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Некорректные слоты доступности")
+    return slots
 
 async def get_student(db: AsyncSession, student_id: int):
+    cached = cache.students.get(student_id)
+    if cached is not cache.MISSING:
+        return cached
+    generation = cache.students.generation
     query = text("""
         SELECT student_id, user_id, education_level, interests
         FROM students
@@ -219,18 +426,24 @@ async def get_student(db: AsyncSession, student_id: int):
     result = await db.execute(query, {"student_id": student_id})
     row = result.fetchone()
     if row:
-        return {
+        student = {
             "student_id": row.student_id,
             "user_id": row.user_id,
             "education_level": row.education_level,
             "interests": row.interests
         }
+        cache.students.set(student_id, student, generation)
+        return student
     return None
 
 
 
 
 async def get_subject_by_id(db: AsyncSession, subject_id: int):
+    cached = cache.subjects.get(subject_id)
+    if cached is not cache.MISSING:
+        return cached
+    generation = cache.subjects.generation
     query = text("""
         SELECT subject_id, subject_name, description
         FROM subjects
@@ -240,30 +453,88 @@ async def get_subject_by_id(db: AsyncSession, subject_id: int):
     res = await db.execute(query, {"subject_id": subject_id})
     row = res.fetchone()
     if row:
-        return {
+        subject = {
             "subject_id": row.subject_id,
             "subject_name": row.subject_name,
             "description": row.description
         }
+        cache.subjects.set(subject_id, subject, generation)
+        return subject
     return None
 
 
+async def get_table_version(db: AsyncSession, table_name: str):
+    # (версия, время изменения) из table_versions; (0, None), если счётчика для таблицы нет
+    query = text("""
+        SELECT version, updated_at
+        FROM table_versions
+        WHERE table_name = :table_name;
+    """)
+    row = (await db.execute(query, {"table_name": table_name})).fetchone()
+    if row is None:
+        return 0, None
+    return row.version, row.updated_at
+
+async def get_table_versions(db: AsyncSession, table_names: List[str]):
+    # {таблица: (версия, время изменения)} для таблиц, у которых есть счётчик
+    query = text("""
+        SELECT table_name, version, updated_at
+        FROM table_versions
+        WHERE table_name = ANY(CAST(:table_names AS TEXT[]));
+    """)
+    result = await db.execute(query, {"table_names": list(table_names)})
+    return {row.table_name: (row.version, row.updated_at) for row in result.fetchall()}
+
+async def get_subjects_catalog(db: AsyncSession):
+    # Весь справочник предметов из снимка в памяти; в БД обычно уходит
+    # только проверка версии, и то не чаще раза в несколько секунд
+    catalog = cache.subject_catalog
+    if catalog.is_fresh():
+        return catalog
+    async with catalog.lock:
+        if catalog.is_fresh():
+            return catalog
+        version, updated_at = await get_table_version(db, "subjects")
+        if version == 0 or version != catalog.version:
+            query = text("""
+                SELECT subject_id, subject_name, description
+                FROM subjects
+                ORDER BY subject_id;
+            """)
+            result = await db.execute(query)
+            rows = [
+                {"subject_id": row.subject_id, "subject_name": row.subject_name, "description": row.description}
+                for row in result.fetchall()
+            ]
+            catalog.load(version, updated_at, rows)
+            cache.subjects.clear()
+        catalog.mark_checked()
+    return catalog
+
+
 async def create_lesson(db: AsyncSession, lesson: schemas.LessonCreate):
     query = text("""
-        INSERT INTO lessons (tutor_id, student_id, subject_id, lesson_date, lesson_time, status)
-        VALUES (:tutor_id, :student_id, :subject_id, :lesson_date, :lesson_time, :status)
-        RETURNING lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, status;
+        INSERT INTO lessons (tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status)
+        VALUES (:tutor_id, :student_id, :subject_id, :lesson_date, :lesson_time, :duration_minutes, :status)
+        RETURNING lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status;
     """)
-    result = await db.execute(query, {
-        "tutor_id": lesson.tutor_id,
-        "student_id": lesson.student_id,
-        "subject_id": lesson.subject_id,
-        "lesson_date": lesson.lesson_date,
-        "lesson_time": lesson.lesson_time,
-        "status": lesson.status or "scheduled"
-    })
-    row = result.fetchone()
-    await db.commit()
+    try:
+        result = await db.execute(query, {
+            "tutor_id": lesson.tutor_id,
+            "student_id": lesson.student_id,
+            "subject_id": lesson.subject_id,
+            "lesson_date": lesson.lesson_date,
+            "lesson_time": lesson.lesson_time,
+            "duration_minutes": lesson.duration_minutes,
+            "status": lesson.status or "scheduled"
+        })
+        row = result.fetchone()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_exclusion_violation(e):
+            raise HTTPException(status_code=409, detail=LESSON_CONFLICT_DETAIL)
+        raise HTTPException(status_code=400, detail="Некорректные данные занятия")
     if row:
         return {
             "lesson_id": row.lesson_id,
@@ -272,12 +543,123 @@ async def create_lesson(db: AsyncSession, lesson: schemas.LessonCreate):
             "subject_id": row.subject_id,
             "lesson_date": row.lesson_date,
             "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
             "status": row.status
         }
     return None
 
-async def get_lessons_by_student(db: AsyncSession, student_id: int):
+MAX_BULK_LESSONS = 500
+
+def _first_recurrence_date(recurrence: schemas.LessonRecurrence):
+    return recurrence.start_date + timedelta(days=(recurrence.weekday - recurrence.start_date.weekday()) % 7)
+
+def count_recurrence(recurrence: schemas.LessonRecurrence) -> int:
+    # Число занятий в серии без построения самих дат
+    try:
+        first_date = _first_recurrence_date(recurrence)
+    except OverflowError:
+        return 0
+    if first_date > recurrence.end_date:
+        return 0
+    return (recurrence.end_date - first_date).days // 7 + 1
+
+def expand_recurrence(recurrence: schemas.LessonRecurrence):
+    # Все даты между start_date и end_date, приходящиеся на нужный день недели
+    count = count_recurrence(recurrence)
+    if count == 0:
+        return []
+    first_date = _first_recurrence_date(recurrence)
+    return [
+        schemas.LessonCreate(
+            tutor_id=recurrence.tutor_id,
+            student_id=recurrence.student_id,
+            subject_id=recurrence.subject_id,
+            lesson_date=first_date + timedelta(weeks=week),
+            lesson_time=recurrence.lesson_time,
+            duration_minutes=recurrence.duration_minutes,
+            status=recurrence.status,
+        )
+        for week in range(count)
+    ]
+
+async def create_lessons_bulk(db: AsyncSession, lessons: List[schemas.LessonCreate]):
+    # Все занятия вставляются одним многострочным INSERT через unnest в одной транзакции
     query = text("""
+        INSERT INTO lessons (tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status)
+        SELECT *
+        FROM unnest(
+            CAST(:tutor_ids AS INTEGER[]),
+            CAST(:student_ids AS INTEGER[]),
+            CAST(:subject_ids AS INTEGER[]),
+            CAST(:lesson_dates AS DATE[]),
+            CAST(:lesson_times AS TIME[]),
+            CAST(:durations AS INTEGER[]),
+            CAST(:statuses AS VARCHAR[])
+        )
+        RETURNING lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status;
+    """)
+    try:
+        result = await db.execute(query, {
+            "tutor_ids": [lesson.tutor_id for lesson in lessons],
+            "student_ids": [lesson.student_id for lesson in lessons],
+            "subject_ids": [lesson.subject_id for lesson in lessons],
+            "lesson_dates": [lesson.lesson_date for lesson in lessons],
+            "lesson_times": [lesson.lesson_time for lesson in lessons],
+            "durations": [lesson.duration_minutes for lesson in lessons],
+            "statuses": [lesson.status or "scheduled" for lesson in lessons],
+        })
+        rows = result.fetchall()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_exclusion_violation(e):
+            raise HTTPException(status_code=409, detail=LESSON_CONFLICT_DETAIL)
+        raise HTTPException(status_code=400, detail="Некорректные данные занятий")
+
+    return [
+        {
+            "lesson_id": row.lesson_id,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id,
+            "subject_id": row.subject_id,
+            "lesson_date": row.lesson_date,
+            "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
+            "status": row.status,
+        }
+        for row in sorted(rows, key=lambda r: (r.lesson_date, r.lesson_time))
+    ]
+
+def _lesson_page_filter(params: dict, date_from=None, date_to=None, status=None, after=None):
+    # Фильтры и keyset-условие для страницы занятий; порядок (lesson_date, lesson_time, lesson_id)
+    # совпадает с индексами idx_lessons_*_page
+    filters = []
+    if date_from is not None:
+        filters.append("lesson_date >= :date_from")
+        params["date_from"] = date_from
+    if date_to is not None:
+        filters.append("lesson_date <= :date_to")
+        params["date_to"] = date_to
+    if status is not None:
+        filters.append("status = :status")
+        params["status"] = status
+    if after is not None:
+        filters.append("(lesson_date, lesson_time, lesson_id) > (:after_date, :after_time, :after_id)")
+        params["after_date"], params["after_time"], params["after_id"] = after
+    return "".join(f" AND {f}" for f in filters)
+
+async def get_lessons_by_student(
+    db: AsyncSession,
+    student_id: int,
+    date_from=None,
+    date_to=None,
+    status: str = None,
+    after: tuple = None,
+    limit: int = 100,
+):
+    params = {"student_id": student_id, "limit": limit}
+    page_filter = _lesson_page_filter(params, date_from, date_to, status, after)
+    query = text(f"""
         SELECT 
             lesson_id,
             tutor_id,
@@ -285,12 +667,14 @@ async def get_lessons_by_student(db: AsyncSession, student_id: int):
             subject_id,
             lesson_date,
             lesson_time,
+            duration_minutes,
             status
         FROM lessons
-        WHERE student_id = :student_id
-        ORDER BY lesson_date, lesson_time;
+        WHERE student_id = :student_id{page_filter}
+        ORDER BY lesson_date, lesson_time, lesson_id
+        LIMIT :limit;
     """)
-    result = await db.execute(query, {"student_id": student_id})
+    result = await db.execute(query, params)
     rows = result.fetchall()
 
     lessons = []
@@ -302,6 +686,7 @@ async def get_lessons_by_student(db: AsyncSession, student_id: int):
             "subject_id": row.subject_id,
             "lesson_date": row.lesson_date,
             "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
             "status": row.status
         })
     return lessons
@@ -310,14 +695,59 @@ async def get_lessons_by_student(db: AsyncSession, student_id: int):
 
 
 
-async def get_lessons_by_tutor(db: AsyncSession, tutor_id: int):
+async def get_lessons_by_student_expanded(db: AsyncSession, student_id: int):
+    # Расписание ученика вместе с именем преподавателя и названием предмета одним запросом
     query = text("""
-        SELECT lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, status
+        SELECT l.lesson_id, l.tutor_id, l.student_id, l.subject_id,
+               l.lesson_date, l.lesson_time, l.duration_minutes, l.status,
+               u.first_name AS tutor_first_name, u.last_name AS tutor_last_name,
+               sub.subject_name
+        FROM lessons AS l
+        JOIN tutors AS t ON t.tutor_id = l.tutor_id
+        JOIN users AS u ON u.user_id = t.user_id
+        JOIN subjects AS sub ON sub.subject_id = l.subject_id
+        WHERE l.student_id = :student_id
+        ORDER BY l.lesson_date, l.lesson_time;
+    """)
+    result = await db.execute(query, {"student_id": student_id})
+    rows = result.fetchall()
+    return [
+        {
+            "lesson_id": row.lesson_id,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id,
+            "subject_id": row.subject_id,
+            "lesson_date": row.lesson_date,
+            "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
+            "status": row.status,
+            "tutor_first_name": row.tutor_first_name,
+            "tutor_last_name": row.tutor_last_name,
+            "subject_name": row.subject_name,
+        }
+        for row in rows
+    ]
+
+
+async def get_lessons_by_tutor(
+    db: AsyncSession,
+    tutor_id: int,
+    date_from=None,
+    date_to=None,
+    status: str = None,
+    after: tuple = None,
+    limit: int = 100,
+):
+    params = {"tutor_id": tutor_id, "limit": limit}
+    page_filter = _lesson_page_filter(params, date_from, date_to, status, after)
+    query = text(f"""
+        SELECT lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status
         FROM lessons
-        WHERE tutor_id = :tutor_id
-        ORDER BY lesson_date, lesson_time;
+        WHERE tutor_id = :tutor_id{page_filter}
+        ORDER BY lesson_date, lesson_time, lesson_id
+        LIMIT :limit;
     """)
-    result = await db.execute(query, {"tutor_id": tutor_id})
+    result = await db.execute(query, params)
     rows = result.fetchall()
     return [
         {
@@ -327,61 +757,168 @@ async def get_lessons_by_tutor(db: AsyncSession, tutor_id: int):
             "subject_id": row.subject_id,
             "lesson_date": row.lesson_date,
             "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
             "status": row.status,
         }
         for row in rows
     ]
 
 
-async def create_feedback(db: AsyncSession, feedback: schemas.FeedbackCreate):
-    check_lesson_query = text("""
-        SELECT lesson_id 
+async def get_lessons_by_tutor_expanded(db: AsyncSession, tutor_id: int, date_from=None, date_to=None):
+    # Расписание репетитора с данными ученика и предмета одним запросом
+    filters = ["l.tutor_id = :tutor_id"]
+    params = {"tutor_id": tutor_id}
+    if date_from is not None:
+        filters.append("l.lesson_date >= :date_from")
+        params["date_from"] = date_from
+    if date_to is not None:
+        filters.append("l.lesson_date <= :date_to")
+        params["date_to"] = date_to
+    where_clause = " AND ".join(filters)
+
+    query = text(f"""
+        SELECT l.lesson_id, l.tutor_id, l.student_id, l.subject_id,
+               l.lesson_date, l.lesson_time, l.duration_minutes, l.status,
+               u.first_name AS student_first_name, u.last_name AS student_last_name,
+               s.education_level, sub.subject_name
+        FROM lessons AS l
+        JOIN students AS s ON s.student_id = l.student_id
+        JOIN users AS u ON u.user_id = s.user_id
+        JOIN subjects AS sub ON sub.subject_id = l.subject_id
+        WHERE {where_clause}
+        ORDER BY l.lesson_date, l.lesson_time;
+    """)
+    result = await db.execute(query, params)
+    rows = result.fetchall()
+    return [
+        {
+            "lesson_id": row.lesson_id,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id,
+            "subject_id": row.subject_id,
+            "lesson_date": row.lesson_date,
+            "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
+            "status": row.status,
+            "student_first_name": row.student_first_name,
+            "student_last_name": row.student_last_name,
+            "education_level": row.education_level,
+            "subject_name": row.subject_name,
+        }
+        for row in rows
+    ]
+
+
+async def get_tutor_conflicts(db: AsyncSession, tutor_id: int, period_start, period_end):
+    # Пересечение по lesson_period обслуживается GiST-индексом EXCLUDE-ограничения
+    query = text("""
+        SELECT lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status
         FROM lessons
-        WHERE lesson_id = :lesson_id AND tutor_id = :tutor_id AND student_id = :student_id
-        LIMIT 1;
+        WHERE tutor_id = :tutor_id
+          AND status <> 'canceled'
+          AND lesson_period && tsrange(:period_start, :period_end)
+        ORDER BY lesson_date, lesson_time;
     """)
-    check_res = await db.execute(check_lesson_query, {
-        "lesson_id": feedback.lesson_id,
-        "tutor_id": feedback.tutor_id,
-        "student_id": feedback.student_id
+    result = await db.execute(query, {
+        "tutor_id": tutor_id,
+        "period_start": period_start,
+        "period_end": period_end
     })
-    lesson_row = check_res.fetchone()
-    if not lesson_row:
-        raise HTTPException(status_code=400, detail="Указанный урок не найден или не соответствует преподавателю/ученику.")
+    rows = result.fetchall()
+    return [
+        {
+            "lesson_id": row.lesson_id,
+            "tutor_id": row.tutor_id,
+            "student_id": row.student_id,
+            "subject_id": row.subject_id,
+            "lesson_date": row.lesson_date,
+            "lesson_time": row.lesson_time,
+            "duration_minutes": row.duration_minutes,
+            "status": row.status,
+        }
+        for row in rows
+    ]
+
 
+async def create_feedback(db: AsyncSession, feedback: schemas.FeedbackCreate):
+    # Проверка урока (преподаватель, ученик, статус) и вставка отзыва одним запросом
     insert_feedback_query = text("""
         INSERT INTO feedbacks (lesson_id, tutor_id, rating, comment)
-        VALUES (:lesson_id, :tutor_id, :rating, :comment)
+        SELECT l.lesson_id, l.tutor_id, :rating, :comment
+        FROM lessons AS l
+        WHERE l.lesson_id = :lesson_id
+          AND l.tutor_id = :tutor_id
+          AND l.student_id = :student_id
+          AND l.status = 'completed'
         RETURNING feedback_id, lesson_id, tutor_id, rating, comment;
     """)
-    result = await db.execute(insert_feedback_query, {
-        "lesson_id": feedback.lesson_id,
-        "tutor_id": feedback.tutor_id,
-        "rating": feedback.rating,
-        "comment": feedback.comment
-    })
+    try:
+        result = await db.execute(insert_feedback_query, {
+            "lesson_id": feedback.lesson_id,
+            "tutor_id": feedback.tutor_id,
+            "student_id": feedback.student_id,
+            "rating": feedback.rating,
+            "comment": feedback.comment
+        })
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e):
+            raise HTTPException(status_code=409, detail="Отзыв на этот урок уже оставлен.")
+        raise HTTPException(status_code=400, detail="Некорректные данные отзыва.")
     db_feedback = result.fetchone()
+    if not db_feedback:
+        await db.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail="Указанный урок не найден, не соответствует преподавателю/ученику или ещё не завершён."
+        )
     await db.commit()
+    # Триггер обновил рейтинг репетитора
+    cache.tutors.invalidate(feedback.tutor_id)
 
-    if db_feedback:
-        return {
-            "feedback_id": db_feedback.feedback_id,
-            "lesson_id": db_feedback.lesson_id,
-            "tutor_id": db_feedback.tutor_id,
-            "rating": db_feedback.rating,
-            "comment": db_feedback.comment
-        }
-    return None
+    return {
+        "feedback_id": db_feedback.feedback_id,
+        "lesson_id": db_feedback.lesson_id,
+        "tutor_id": db_feedback.tutor_id,
+        "rating": db_feedback.rating,
+        "comment": db_feedback.comment
+    }
 
 
-async def get_feedbacks_by_tutor(db: AsyncSession, tutor_id: int):
-    query = text("""
+async def get_feedbacks_by_tutor(
+    db: AsyncSession,
+    tutor_id: int,
+    before_id: int = None,
+    limit: int = 50,
+    date_from=None,
+    date_to=None,
+    rating: int = None,
+):
+    # Keyset-пагинация по feedback_id (индекс tutor_id, feedback_id DESC)
+    params = {"tutor_id": tutor_id, "limit": limit}
+    filters = []
+    if before_id is not None:
+        filters.append("feedback_id < :before_id")
+        params["before_id"] = before_id
+    if date_from is not None:
+        filters.append("created_at >= :date_from")
+        params["date_from"] = date_from
+    if date_to is not None:
+        filters.append("created_at < CAST(:date_to AS DATE) + 1")
+        params["date_to"] = date_to
+    if rating is not None:
+        filters.append("rating = :rating")
+        params["rating"] = rating
+    page_filter = "".join(f" AND {f}" for f in filters)
+
+    query = text(f"""
         SELECT feedback_id, lesson_id, tutor_id, rating, comment
         FROM feedbacks
-        WHERE tutor_id = :tutor_id
-        ORDER BY feedback_id DESC;
+        WHERE tutor_id = :tutor_id{page_filter}
+        ORDER BY feedback_id DESC
+        LIMIT :limit;
     """)
-    result = await db.execute(query, {"tutor_id": tutor_id})
+    result = await db.execute(query, params)
     rows = result.fetchall()
     feedbacks = []
     for row in rows:
@@ -395,7 +932,72 @@ async def get_feedbacks_by_tutor(db: AsyncSession, tutor_id: int):
     return feedbacks
 
 
+async def get_feedback_stats(db: AsyncSession, tutor_id: int):
+    # Все значения берутся из агрегатов, которые поддерживает триггер на feedbacks
+    query = text("""
+        SELECT t.tutor_id, t.rating_sum, t.rating_count,
+               COALESCE(s.stars_1, 0) AS stars_1, COALESCE(s.stars_2, 0) AS stars_2,
+               COALESCE(s.stars_3, 0) AS stars_3, COALESCE(s.stars_4, 0) AS stars_4,
+               COALESCE(s.stars_5, 0) AS stars_5,
+               recent.rating_sum AS recent_sum, recent.rating_count AS recent_count
+        FROM tutors AS t
+        LEFT JOIN tutor_feedback_stats AS s ON s.tutor_id = t.tutor_id
+        CROSS JOIN LATERAL (
+            SELECT SUM(d.rating_sum) AS rating_sum, SUM(d.rating_count) AS rating_count
+            FROM tutor_feedback_daily AS d
+            WHERE d.tutor_id = t.tutor_id
+              AND d.day > CURRENT_DATE - 30
+        ) AS recent
+        WHERE t.tutor_id = :tutor_id
+        LIMIT 1;
+    """)
+    result = await db.execute(query, {"tutor_id": tutor_id})
+    row = result.fetchone()
+    if row:
+        return {
+            "tutor_id": row.tutor_id,
+            "total_count": row.rating_count,
+            "average": round(row.rating_sum / row.rating_count, 2) if row.rating_count else 0.0,
+            "average_30d": round(row.recent_sum / row.recent_count, 2) if row.recent_count else None,
+            "count_30d": row.recent_count or 0,
+            "histogram": {
+                1: row.stars_1,
+                2: row.stars_2,
+                3: row.stars_3,
+                4: row.stars_4,
+                5: row.stars_5,
+            },
+        }
+    return None
+
+
+EXPORT_QUERIES = {
+    "lessons": """
+        SELECT lesson_id, tutor_id, student_id, subject_id, lesson_date, lesson_time, duration_minutes, status
+        FROM lessons
+        ORDER BY lesson_id;
+    """,
+    "feedbacks": """
+        SELECT feedback_id, lesson_id, tutor_id, rating, comment, created_at
+        FROM feedbacks
+        ORDER BY feedback_id;
+    """,
+}
+
+async def stream_export(db: AsyncSession, table: str, fetch_size: int):
+    # Серверный курсор: строки читаются пачками по fetch_size, вся таблица в память не загружается
+    query = text(EXPORT_QUERIES[table]).execution_options(yield_per=fetch_size)
+    result = await db.stream(query)
+    yield list(result.keys())
+    async for rows in result.partitions():
+        yield rows
+
+
 async def get_tutor_by_user_id(db: AsyncSession, user_id: int):
+    tutor_id = cache.tutor_ids_by_user.get(user_id)
+    if tutor_id is not cache.MISSING:
+        return await get_tutor(db, tutor_id)
+    generation = cache.tutors.generation
     query = text("""
         SELECT tutor_id, user_id, description, experience, rating
         FROM tutors
@@ -405,16 +1007,23 @@ async def get_tutor_by_user_id(db: AsyncSession, user_id: int):
     result = await db.execute(query, {"user_id": user_id})
     row = result.fetchone()
     if row:
-        return {
+        tutor = {
             "tutor_id": row.tutor_id,
             "user_id": row.user_id,
             "description": row.description,
             "experience": row.experience,
             "rating": float(row.rating)
         }
+        cache.tutors.set(row.tutor_id, tutor, generation)
+        cache.tutor_ids_by_user.set(user_id, row.tutor_id, cache.tutor_ids_by_user.generation)
+        return tutor
     return None
 
 async def get_student_by_user_id(db: AsyncSession, user_id: int):
+    student_id = cache.student_ids_by_user.get(user_id)
+    if student_id is not cache.MISSING:
+        return await get_student(db, student_id)
+    generation = cache.students.generation
     query = text("""
         SELECT student_id, user_id, education_level, interests
         FROM students
@@ -424,10 +1033,13 @@ async def get_student_by_user_id(db: AsyncSession, user_id: int):
     result = await db.execute(query, {"user_id": user_id})
     row = result.fetchone()
     if row:
-        return {
+        student = {
             "student_id": row.student_id,
             "user_id": row.user_id,
             "education_level": row.education_level,
             "interests": row.interests
         }
+        cache.students.set(row.student_id, student, generation)
+        cache.student_ids_by_user.set(user_id, row.student_id, cache.student_ids_by_user.generation)
+        return student
     return None
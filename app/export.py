@@ -0,0 +1,40 @@
+import csv
+import io
+import json
+
+from .config import settings
+from .database import async_session
+from . import crud
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def export_chunks(table: str, fmt: str):
+    # Своя сессия: генератор работает уже после выхода из обработчика и зависимостей
+    async with async_session() as db:
+        batches = crud.stream_export(db, table, settings.export_fetch_size)
+        try:
+            columns = await batches.__anext__()
+
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+
+            async for rows in batches:
+                if fmt == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + "\n"
+                        for row in rows
+                    )
+        finally:
+            await batches.aclose()
@@ -1,18 +1,60 @@
 
 import uvicorn
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
 from sqlalchemy import text
-from .database import get_db
-from .utils import create_access_token, verify_password
-from .auth import get_current_user
-from . import crud, schemas
-
-
-
-app = FastAPI()
+from sqlalchemy.exc import IntegrityError
+from .config import settings
+from .database import get_db, log_pool_settings, pool_status
+from .utils import create_access_token, decode_cursor, encode_cursor, verify_password_async
+from .auth import get_current_admin_user, get_current_user, get_current_user_fresh
+from .conditional import conditional_get, etag_matches
+from .tasks import start_background_tasks
+from .export import EXPORT_MEDIA_TYPES, export_chunks
+from . import cache, crud, schemas
+
+
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+def list_response(rows: list, response: Response = None):
+    # Строки из crud уже имеют форму response_model: при включённой настройке
+    # они сериализуются orjson напрямую, без поэлементной валидации pydantic
+    if not settings.fast_list_responses:
+        return rows
+    fast_response = ORJSONResponse(rows)
+    if response is not None:
+        fast_response.headers.update(response.headers)
+    return fast_response
+
+background_tasks = []
+
+@app.on_event("startup")
+async def on_startup():
+    log_pool_settings()
+    background_tasks.extend(start_background_tasks())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+
+@app.get("/healthz/db")
+async def healthz_db(db: AsyncSession = Depends(get_db)):
+    try:
+        await db.execute(text("SELECT 1;"))
+    except Exception:
+        raise HTTPException(status_code=503, detail={"status": "unavailable", "pool": pool_status()})
+    return {"status": "ok", "pool": pool_status()}
+
+@app.get("/healthz/cache")
+async def healthz_cache():
+    return cache.stats()
 
 @app.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
@@ -20,45 +62,25 @@ async def login_for_access_token(
     db: AsyncSession = Depends(get_db)
 ):
     user = await crud.get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user["auth"]["password_hash"]):
+    if not user or not await verify_password_async(form_data.password, user["auth"]["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": str(user["user_id"])})
+    access_token = create_access_token(data={
+        "sub": str(user["user_id"]),
+        "role_id": user["role_id"],
+        "tutor_id": user["tutor_id"],
+        "student_id": user["student_id"],
+    })
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/users/", response_model=schemas.UserOut)
 async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
-    # Проверяем существование пользователя
-    existing_user_email = await crud.get_user_by_email(db, user.email)
-    existing_user_phone = await crud.get_user_by_phone(db, user.phone)
-    if existing_user_email or existing_user_phone:
-        raise HTTPException(status_code=400, detail="User with this email or phone already exists")
-
-    # Создаём пользователя
+    # Дубликаты email/телефона определяются по нарушению уникальности внутри crud.create_user
     new_user = await crud.create_user(db, user)
 
-    # Создаём запись в таблице tutors или students
-    if user.role_id == 2:  # Если репетитор
-        tutor_data = schemas.TutorCreate(
-            user_id=new_user["user_id"],
-            description="Описание не указано",
-            experience=0
-        )
-        await crud.create_tutor(db, tutor_data)
-    elif user.role_id == 3:  # Если ученик
-        student_data = schemas.StudentCreate(
-            user_id=new_user["user_id"],
-            education_level="Beginner",
-            interests=""
-        )
-        await crud.create_student(db, student_data)
-
-    tutor = await crud.get_tutor_by_user_id(db, new_user["user_id"])
-    student = await crud.get_student_by_user_id(db, new_user["user_id"])
-
     return {
         "user_id": new_user["user_id"],
         "first_name": new_user["first_name"],
@@ -66,17 +88,13 @@ async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_d
         "email": new_user["email"],
         "phone": new_user["phone"],
         "role_id": new_user["role_id"],
-        "tutor_id": tutor["tutor_id"] if tutor else None,
-        "student_id": student["student_id"] if student else None
+        "tutor_id": new_user["tutor_id"],
+        "student_id": new_user["student_id"]
     }
 
 
 @app.get("/users/me/", response_model=schemas.UserOut)
-async def read_users_me(current_user: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    # Получаем данные о репетиторе и ученике
-    tutor = await crud.get_tutor_by_user_id(db, current_user["user_id"])
-    student = await crud.get_student_by_user_id(db, current_user["user_id"])
-
+async def read_users_me(current_user: dict = Depends(get_current_user_fresh)):
     return {
         "user_id": current_user["user_id"],
         "first_name": current_user["first_name"],
@@ -84,37 +102,136 @@ async def read_users_me(current_user: dict = Depends(get_current_user), db: Asyn
         "email": current_user["email"],
         "phone": current_user["phone"],
         "role_id": current_user["role_id"],
-        "tutor_id": tutor["tutor_id"] if tutor else None,
-        "student_id": student["student_id"] if student else None
+        "tutor_id": current_user["tutor_id"],
+        "student_id": current_user["student_id"]
     }
 
 
 
-@app.get("/tutors/", response_model=List[schemas.TutorOut])
-async def get_tutors_endpoint(db: AsyncSession = Depends(get_db)):
-    tutors = await crud.get_tutors(db)
-    tutor_out_list = []
-    for t in tutors:
-        user_data = await crud.get_user(db, t["user_id"])
-        tutor_out_list.append({
-            "tutor_id": t["tutor_id"],
-            "user": {
-                "user_id": user_data["user_id"],
-                "first_name": user_data["first_name"],
-                "last_name": user_data["last_name"],
-                "email": user_data["email"],
-                "phone": user_data["phone"],
-                "role_id": user_data["role_id"],
-                "tutor_id": None,
-                "student_id": None,
-            },
-            "description": t["description"],
-            "experience": t["experience"],
-            "rating": t["rating"]
-        })
-    return tutor_out_list
-
-@app.get("/tutors/{tutor_id}", response_model=schemas.TutorOut)
+def _set_next_page(request: Request, response: Response, cursor: Optional[str]):
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+
+def _tutor_cursor(cursor: str, sort_by: str):
+    values = decode_cursor(cursor)
+    try:
+        if values["s"] != sort_by:
+            raise ValueError
+        # Рейтинг хранится в курсоре строкой и разбирается в Decimal без потери точности
+        value = Decimal(values["v"]) if sort_by == "rating" else int(values["v"])
+        if sort_by == "rating" and not value.is_finite():
+            raise ValueError
+        return value, int(values["id"])
+    except (TypeError, KeyError, ValueError, InvalidOperation):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+def _next_tutor_cursor(tutors: list, last_key, limit: int, sort_by: str):
+    if len(tutors) < limit or last_key is None:
+        return None
+    value, tutor_id = last_key
+    return encode_cursor({"s": sort_by, "v": str(value), "id": tutor_id})
+
+@app.get(
+    "/tutors/",
+    response_model=List[schemas.TutorOut],
+    dependencies=[conditional_get("tutors", "users")],
+)
+async def get_tutors_endpoint(
+    request: Request,
+    response: Response,
+    sort_by: str = "rating",
+    after_rating: Optional[Decimal] = None,
+    after_experience: Optional[int] = None,
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    if sort_by not in crud.TUTOR_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail="Некорректный параметр сортировки")
+
+    if cursor is not None:
+        after_value, after_id = _tutor_cursor(cursor, sort_by)
+    else:
+        after_value = after_rating if sort_by == "rating" else after_experience
+    tutors, last_key = await crud.get_tutors_with_users(
+        db,
+        sort_by=sort_by,
+        after_value=after_value,
+        after_id=after_id,
+        limit=limit,
+    )
+    _set_next_page(request, response, _next_tutor_cursor(tutors, last_key, limit, sort_by))
+    return list_response(tutors, response)
+
+@app.get("/tutors/top", response_model=List[schemas.TutorLeaderboardOut])
+async def get_top_tutors_endpoint(
+    subject_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    return list_response(await crud.get_top_tutors(db, subject_id, limit))
+
+@app.get(
+    "/tutors/search",
+    response_model=List[schemas.TutorOut],
+    dependencies=[conditional_get("tutors", "users")],
+)
+async def search_tutors_endpoint(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    # Порядок по релевантности не даёт устойчивого ключа, поэтому курсор хранит смещение
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        try:
+            offset = int(values["o"])
+        except (TypeError, KeyError, ValueError):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        if not 0 <= offset <= 10000:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+    tutors = await crud.search_tutors(db, q, limit, offset)
+    if len(tutors) == limit and offset + limit <= 10000:
+        _set_next_page(request, response, encode_cursor({"o": offset + limit}))
+    return list_response(tutors, response)
+
+def _to_lesson_time(value: datetime) -> datetime:
+    # Занятия хранятся без часового пояса, в местном времени settings.lesson_timezone.
+    # Время со смещением переводится в этот пояс; если пояс не настроен, такое время
+    # отклоняется, чтобы 10:00Z и 10:00+03:00 не превращались в одно и то же окно
+    if value.tzinfo is None:
+        return value
+    if settings.lesson_timezone is None:
+        raise HTTPException(status_code=400, detail="Укажите время без часового пояса")
+    return value.astimezone(settings.lesson_timezone).replace(tzinfo=None)
+
+@app.get("/tutors/available", response_model=List[schemas.TutorOut])
+async def get_available_tutors_endpoint(
+    subject_id: int,
+    period_start: datetime = Query(..., alias="from"),
+    period_end: datetime = Query(..., alias="to"),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    period_start = _to_lesson_time(period_start)
+    period_end = _to_lesson_time(period_end)
+    if period_start >= period_end:
+        raise HTTPException(status_code=400, detail="Начало интервала должно быть раньше конца")
+    if period_start.date() != period_end.date():
+        raise HTTPException(status_code=400, detail="Интервал должен укладываться в один день")
+    return list_response(await crud.get_available_tutors(db, subject_id, period_start, period_end, limit))
+
+@app.get(
+    "/tutors/{tutor_id}",
+    response_model=schemas.TutorOut,
+    dependencies=[conditional_get("tutors", "users")],
+)
 async def read_tutor(tutor_id: int, db: AsyncSession = Depends(get_db)):
     t = await crud.get_tutor(db, tutor_id)
     if not t:
@@ -137,6 +254,44 @@ async def read_tutor(tutor_id: int, db: AsyncSession = Depends(get_db)):
         "rating": t["rating"]
     }
 
+@app.get("/tutors/{tutor_id}/conflicts", response_model=List[schemas.LessonOut])
+async def get_tutor_conflicts_endpoint(
+    tutor_id: int,
+    period_start: datetime = Query(..., alias="from"),
+    period_end: datetime = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_db),
+):
+    period_start = _to_lesson_time(period_start)
+    period_end = _to_lesson_time(period_end)
+    if period_start >= period_end:
+        raise HTTPException(status_code=400, detail="Начало интервала должно быть раньше конца")
+    return await crud.get_tutor_conflicts(db, tutor_id, period_start, period_end)
+
+def _require_tutor(current_user: dict, tutor_id: int):
+    # tutor_id берётся из токена, дополнительный запрос в БД не нужен
+    if current_user.get("tutor_id") != tutor_id:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+@app.put("/tutors/{tutor_id}/subjects")
+async def update_tutor_subjects(
+    tutor_id: int,
+    update_data: schemas.TutorSubjectsUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    _require_tutor(current_user, tutor_id)
+    return await crud.set_tutor_subjects(db, tutor_id, update_data.subject_ids)
+
+@app.put("/tutors/{tutor_id}/availability", response_model=List[schemas.AvailabilitySlot])
+async def update_tutor_availability(
+    tutor_id: int,
+    slots: List[schemas.AvailabilitySlot],
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    _require_tutor(current_user, tutor_id)
+    return await crud.set_tutor_availability(db, tutor_id, slots)
+
 @app.put("/tutors/{tutor_id}/description")
 async def update_tutor_description(
     tutor_id: int,
@@ -161,6 +316,8 @@ async def update_tutor_description(
     updated_row = result.fetchone()
     await db.commit()
 
+    cache.tutors.invalidate(tutor_id)
+
     if not updated_row:
         raise HTTPException(status_code=404, detail="Репетитор не найден")
 
@@ -171,7 +328,11 @@ async def update_tutor_description(
     }
 
 
-@app.get("/students/{student_id}", response_model=schemas.StudentOut)
+@app.get(
+    "/students/{student_id}",
+    response_model=schemas.StudentOut,
+    dependencies=[conditional_get("students", "users")],
+)
 async def read_student(student_id: int, db: AsyncSession = Depends(get_db)):
     s = await crud.get_student(db, student_id)
     if s is None:
@@ -217,6 +378,8 @@ async def update_student_profile(
     updated_row = result.fetchone()
     await db.commit()
 
+    cache.students.invalidate(student_id)
+
     if not updated_row:
         raise HTTPException(status_code=404, detail="Ученик не найден")
 
@@ -234,18 +397,127 @@ async def create_lesson_endpoint(lesson: schemas.LessonCreate, db: AsyncSession
         raise HTTPException(status_code=500, detail="Не удалось создать урок")
     return new_lesson
 
-@app.get("/lessons/student/{student_id}", response_model=List[schemas.LessonOut])
-async def get_lessons_by_student_endpoint(student_id: int, db: AsyncSession = Depends(get_db)):
-    lessons = await crud.get_lessons_by_student(db, student_id)
-    return lessons
+@app.post("/lessons/bulk", response_model=List[schemas.LessonOut])
+async def create_lessons_bulk_endpoint(bulk: schemas.LessonBulkCreate, db: AsyncSession = Depends(get_db)):
+    if (bulk.lessons is None) == (bulk.recurrence is None):
+        raise HTTPException(status_code=400, detail="Укажите либо список занятий, либо правило повторения")
+
+    if bulk.recurrence is not None:
+        if not 0 <= bulk.recurrence.weekday <= 6:
+            raise HTTPException(status_code=400, detail="Некорректный день недели")
+        if bulk.recurrence.start_date > bulk.recurrence.end_date:
+            raise HTTPException(status_code=400, detail="Дата начала позже даты окончания")
+        # Размер серии проверяется до построения дат: иначе длинный интервал
+        # заставил бы создать сотни тысяч объектов
+        count = crud.count_recurrence(bulk.recurrence)
+    else:
+        count = len(bulk.lessons)
+
+    if count > crud.MAX_BULK_LESSONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Нельзя создать больше {crud.MAX_BULK_LESSONS} занятий за один запрос"
+        )
+    if count == 0:
+        return []
+    lessons = crud.expand_recurrence(bulk.recurrence) if bulk.recurrence is not None else bulk.lessons
+
+    return await crud.create_lessons_bulk(db, lessons)
+
+def _lesson_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    values = decode_cursor(cursor)
+    try:
+        return date.fromisoformat(values["d"]), time.fromisoformat(values["t"]), int(values["id"])
+    except (TypeError, KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+def _next_lesson_cursor(lessons: list, limit: int):
+    if len(lessons) < limit:
+        return None
+    last = lessons[-1]
+    return encode_cursor({
+        "d": last["lesson_date"].isoformat(),
+        "t": last["lesson_time"].isoformat(),
+        "id": last["lesson_id"],
+    })
+
+@app.get(
+    "/lessons/student/{student_id}",
+    response_model=List[schemas.LessonOut],
+    dependencies=[conditional_get("lessons")],
+)
+async def get_lessons_by_student_endpoint(
+    student_id: int,
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    lessons = await crud.get_lessons_by_student(
+        db, student_id, date_from, date_to, status, _lesson_cursor(cursor), limit
+    )
+    _set_next_page(request, response, _next_lesson_cursor(lessons, limit))
+    return list_response(lessons, response)
+
+
 
+@app.get(
+    "/lessons/student/{student_id}/expanded",
+    response_model=List[schemas.StudentLessonOut],
+    # tutors нужна только для связи с users (tutors.user_id не меняется), поэтому её версия не учитывается
+    dependencies=[conditional_get("lessons", "users", "subjects")],
+)
+async def get_lessons_by_student_expanded_endpoint(
+    student_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+):
+    return list_response(await crud.get_lessons_by_student_expanded(db, student_id), response)
 
 
-@app.get("/lessons/tutor/{tutor_id}", response_model=List[schemas.LessonOut])
-async def get_lessons_by_tutor_endpoint(tutor_id: int, db: AsyncSession = Depends(get_db)):
-    lessons = await crud.get_lessons_by_tutor(db, tutor_id)
 
-    return lessons
+@app.get(
+    "/lessons/tutor/{tutor_id}",
+    response_model=List[schemas.LessonOut],
+    dependencies=[conditional_get("lessons")],
+)
+async def get_lessons_by_tutor_endpoint(
+    tutor_id: int,
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    lessons = await crud.get_lessons_by_tutor(
+        db, tutor_id, date_from, date_to, status, _lesson_cursor(cursor), limit
+    )
+    _set_next_page(request, response, _next_lesson_cursor(lessons, limit))
+    return list_response(lessons, response)
+
+
+@app.get(
+    "/lessons/tutor/{tutor_id}/expanded",
+    response_model=List[schemas.TutorLessonOut],
+    dependencies=[conditional_get("lessons", "students", "users", "subjects")],
+)
+async def get_lessons_by_tutor_expanded_endpoint(
+    tutor_id: int,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db),
+):
+    return list_response(await crud.get_lessons_by_tutor_expanded(db, tutor_id, date_from, date_to), response)
 
 
 @app.put("/lessons/{lesson_id}/status")
@@ -264,19 +536,58 @@ async def update_lesson_status(
         WHERE lesson_id = :lesson_id
         RETURNING lesson_id;
     """)
-    result = await db.execute(query, {"status": request.status, "lesson_id": lesson_id})
-    updated_row = result.fetchone()
-    await db.commit()
+    try:
+        result = await db.execute(query, {"status": request.status, "lesson_id": lesson_id})
+        updated_row = result.fetchone()
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if crud.is_exclusion_violation(e):
+            raise HTTPException(status_code=409, detail=crud.LESSON_CONFLICT_DETAIL)
+        raise
 
     if not updated_row:
         raise HTTPException(status_code=404, detail="Занятие не найдено")
     return {"message": "Статус обновлен"}
 
 
-@app.get("/feedbacks/tutor/{tutor_id}", response_model=List[schemas.FeedbackOut])
-async def read_feedbacks_by_tutor(tutor_id: int, db: AsyncSession = Depends(get_db)):
-    feedbacks = await crud.get_feedbacks_by_tutor(db, tutor_id)
-    return feedbacks
+@app.get(
+    "/feedbacks/tutor/{tutor_id}",
+    response_model=List[schemas.FeedbackOut],
+    dependencies=[conditional_get("feedbacks")],
+)
+async def read_feedbacks_by_tutor(
+    tutor_id: int,
+    request: Request,
+    response: Response,
+    before_id: Optional[int] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    rating: Optional[int] = Query(None, ge=1, le=5),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+):
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        try:
+            before_id = int(values["id"])
+        except (TypeError, KeyError, ValueError):
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    feedbacks = await crud.get_feedbacks_by_tutor(
+        db, tutor_id, before_id, limit, date_from, date_to, rating
+    )
+    next_cursor = encode_cursor({"id": feedbacks[-1]["feedback_id"]}) if len(feedbacks) == limit else None
+    _set_next_page(request, response, next_cursor)
+    return list_response(feedbacks, response)
+
+@app.get("/tutors/{tutor_id}/feedback-stats", response_model=schemas.FeedbackStatsOut)
+async def read_feedback_stats(tutor_id: int, db: AsyncSession = Depends(get_db)):
+    stats = await crud.get_feedback_stats(db, tutor_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="Репетитор не найден")
+    return stats
 
 @app.post("/feedbacks/", response_model=schemas.FeedbackOut)
 async def create_feedback_endpoint(
@@ -293,6 +604,19 @@ async def create_feedback_endpoint(
 
     return new_feedback
 
+@app.get("/subjects/", response_model=List[schemas.SubjectOut])
+async def get_subjects(request: Request, db: AsyncSession = Depends(get_db)):
+    # Справочник меняется редко: отдаётся из снимка в памяти, клиенты кешируют его
+    # на catalog_max_age секунд и затем перепроверяют по ETag
+    catalog = await crud.get_subjects_catalog(db)
+    headers = {
+        "ETag": catalog.etag,
+        "Cache-Control": f"public, max-age={settings.catalog_max_age}",
+    }
+    if etag_matches(request, catalog.etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(catalog.rows, headers=headers)
+
 @app.get("/subjects/{subject_id}", response_model=schemas.SubjectOut)
 async def get_subject(subject_id: int, db: AsyncSession = Depends(get_db)):
     subject = await crud.get_subject_by_id(db, subject_id)
@@ -300,5 +624,22 @@ async def get_subject(subject_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Subject not found")
     return subject
 
+@app.get("/admin/export/{table}")
+async def export_table(
+    table: str,
+    format: str = "ndjson",
+    current_user: dict = Depends(get_current_admin_user),
+):
+    if table not in crud.EXPORT_QUERIES:
+        raise HTTPException(status_code=404, detail="Неизвестная таблица для выгрузки")
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы ndjson и csv")
+
+    return StreamingResponse(
+        export_chunks(table, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import date, time
 
 
@@ -48,6 +48,27 @@ class TutorOut(BaseModel):
         orm_mode = False  
 
 
+class AvailabilitySlot(BaseModel):
+    weekday: int  # 0 - понедельник, 6 - воскресенье
+    start_time: time
+    end_time: time
+
+
+class TutorSubjectsUpdate(BaseModel):
+    subject_ids: List[int]
+
+
+class TutorLeaderboardOut(BaseModel):
+    tutor_id: int
+    first_name: str
+    last_name: str
+    subject_id: Optional[int] = None
+    rank: int
+    review_count: int
+    completed_lessons: int
+    bayesian_rating: float
+
+
 class StudentCreate(BaseModel):
     user_id: int
     education_level: str
@@ -74,9 +95,27 @@ class LessonCreate(BaseModel):
     subject_id: int
     lesson_date: date
     lesson_time: time
+    duration_minutes: int = 60
+    status: Optional[str] = "scheduled"
+
+
+class LessonRecurrence(BaseModel):
+    tutor_id: int
+    student_id: int
+    subject_id: int
+    weekday: int  # 0 - понедельник, 6 - воскресенье
+    lesson_time: time
+    start_date: date
+    end_date: date
+    duration_minutes: int = 60
     status: Optional[str] = "scheduled"
 
 
+class LessonBulkCreate(BaseModel):
+    lessons: Optional[List[LessonCreate]] = None
+    recurrence: Optional[LessonRecurrence] = None
+
+
 class LessonOut(BaseModel):
     lesson_id: int
     tutor_id: int
@@ -84,12 +123,26 @@ class LessonOut(BaseModel):
     subject_id: int
     lesson_date: date
     lesson_time: time
+    duration_minutes: int
     status: str
 
     class Config:
         orm_mode = False  
 
 
+class StudentLessonOut(LessonOut):
+    tutor_first_name: str
+    tutor_last_name: str
+    subject_name: str
+
+
+class TutorLessonOut(LessonOut):
+    student_first_name: str
+    student_last_name: str
+    education_level: Optional[str] = None
+    subject_name: str
+
+
 class FeedbackCreate(BaseModel):
     lesson_id: int
     tutor_id: int
@@ -108,6 +161,14 @@ class FeedbackOut(BaseModel):
     class Config:
         orm_mode = False  
 
+class FeedbackStatsOut(BaseModel):
+    tutor_id: int
+    total_count: int
+    average: float
+    average_30d: Optional[float] = None
+    count_30d: int
+    histogram: Dict[int, int]
+
 class SubjectOut(BaseModel):
     subject_id: int
     subject_name: str
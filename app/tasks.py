@@ -0,0 +1,26 @@
+import asyncio
+import logging
+
+from .config import settings
+from .database import async_session
+from . import crud
+
+logger = logging.getLogger("uvicorn.error")
+
+
+async def leaderboard_refresh_loop():
+    # Периодически обновляет материализованные рейтинги репетиторов
+    while True:
+        await asyncio.sleep(settings.leaderboard_refresh_interval)
+        try:
+            async with async_session() as db:
+                await crud.refresh_leaderboards(db)
+        except Exception:
+            logger.exception("Не удалось обновить рейтинги репетиторов")
+
+
+def start_background_tasks():
+    tasks = []
+    if settings.leaderboard_refresh_interval > 0:
+        tasks.append(asyncio.create_task(leaderboard_refresh_loop()))
+    return tasks
@@ -1,7 +1,14 @@
+import asyncio
+import base64
+import binascii
+import json
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from jose import jwt, JWTError
+from fastapi import HTTPException
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+from .config import settings
 
 SECRET_KEY = "meow"  
 ALGORITHM = "HS256"
@@ -15,6 +22,34 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+# bcrypt занимает ~250 мс CPU, поэтому хеширование выполняется в отдельном пуле потоков,
+# а число одновременных операций ограничено, чтобы не блокировать event loop
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_max_parallel, thread_name_prefix="bcrypt"
+)
+_hash_slots = asyncio.Semaphore(settings.password_hash_max_parallel)
+
+async def _run_in_hash_pool(func, *args):
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), timeout=settings.password_hash_queue_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Сервер перегружен, попробуйте позже",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_hash_pool(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
@@ -29,3 +64,15 @@ def decode_access_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[dict]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return values if isinstance(values, dict) else None
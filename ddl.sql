@@ -1,3 +1,8 @@
+-- btree_gist нужен для EXCLUDE-ограничений по (tutor_id =, lesson_period &&)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+-- pg_trgm нужен для нечёткого поиска репетиторов
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Создание таблицы ролей
 CREATE TABLE roles (
     role_id SERIAL PRIMARY KEY,
@@ -10,7 +15,7 @@ CREATE TABLE users (
     first_name VARCHAR(50) NOT NULL,
     last_name VARCHAR(50) NOT NULL,
     email VARCHAR(100) UNIQUE NOT NULL,
-    phone VARCHAR(20),
+    phone VARCHAR(20) UNIQUE,
     role_id INTEGER REFERENCES roles(role_id) ON DELETE SET NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -29,7 +34,13 @@ CREATE TABLE tutors (
     user_id INTEGER UNIQUE REFERENCES users(user_id) ON DELETE CASCADE,
     description TEXT,
     experience INTEGER NOT NULL DEFAULT 0,
-    rating DECIMAL(3, 2) DEFAULT 0.00
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating DECIMAL(3, 2) GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN ROUND(rating_sum::DECIMAL / rating_count, 2) ELSE 0.00 END
+    ) STORED,
+    search_text TEXT,
+    search_vector TSVECTOR
 );
 
 -- Создание таблицы учеников
@@ -55,7 +66,16 @@ CREATE TABLE lessons (
     subject_id INTEGER REFERENCES subjects(subject_id) ON DELETE CASCADE,
     lesson_date DATE NOT NULL,
     lesson_time TIME NOT NULL,
-    status VARCHAR(50) DEFAULT 'scheduled'
+    duration_minutes INTEGER NOT NULL DEFAULT 60 CHECK (duration_minutes > 0),
+    status VARCHAR(50) DEFAULT 'scheduled',
+    lesson_period TSRANGE GENERATED ALWAYS AS (
+        tsrange(lesson_date + lesson_time, lesson_date + lesson_time + duration_minutes * INTERVAL '1 minute')
+    ) STORED,
+    -- Репетитор и ученик не могут иметь пересекающиеся (неотменённые) занятия
+    CONSTRAINT lessons_tutor_no_overlap
+        EXCLUDE USING gist (tutor_id WITH =, lesson_period WITH &&) WHERE (status <> 'canceled'),
+    CONSTRAINT lessons_student_no_overlap
+        EXCLUDE USING gist (student_id WITH =, lesson_period WITH &&) WHERE (status <> 'canceled')
 );
 
 -- Создание таблицы отзывов
@@ -64,28 +84,371 @@ CREATE TABLE feedbacks (
     lesson_id INTEGER UNIQUE REFERENCES lessons(lesson_id) ON DELETE CASCADE,
     tutor_id INTEGER REFERENCES tutors(tutor_id) ON DELETE CASCADE,
     rating INTEGER CHECK (rating BETWEEN 1 AND 5),
-    comment TEXT
+    comment TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Функция для автоматического обновления рейтинга репетитора
-CREATE OR REPLACE FUNCTION update_tutor_rating_func()
-RETURNS TRIGGER AS $$
+-- Распределение оценок репетитора, поддерживается триггером на feedbacks
+CREATE TABLE tutor_feedback_stats (
+    tutor_id INTEGER PRIMARY KEY REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    stars_1 INTEGER NOT NULL DEFAULT 0,
+    stars_2 INTEGER NOT NULL DEFAULT 0,
+    stars_3 INTEGER NOT NULL DEFAULT 0,
+    stars_4 INTEGER NOT NULL DEFAULT 0,
+    stars_5 INTEGER NOT NULL DEFAULT 0
+);
+
+-- Сумма и количество оценок по дням: среднее за 30 дней читается не более чем из 30 строк
+CREATE TABLE tutor_feedback_daily (
+    tutor_id INTEGER REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tutor_id, day)
+);
+
+-- Предметы, которые ведёт репетитор
+CREATE TABLE tutor_subjects (
+    subject_id INTEGER REFERENCES subjects(subject_id) ON DELETE CASCADE,
+    tutor_id INTEGER REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, tutor_id)
+);
+
+-- Еженедельные слоты доступности репетитора (weekday: 0 - понедельник)
+CREATE TABLE tutor_availability (
+    availability_id SERIAL PRIMARY KEY,
+    tutor_id INTEGER NOT NULL REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    CHECK (start_time < end_time)
+);
+
+-- Применение одного отзыва к агрегатам репетитора с знаком +1 (добавление) или -1 (удаление)
+CREATE OR REPLACE FUNCTION apply_feedback_delta(p_tutor_id INTEGER, p_rating INTEGER, p_day DATE, p_sign INTEGER)
+RETURNS VOID AS $$
 BEGIN
     UPDATE tutors
-    SET rating = (
-        SELECT COALESCE(AVG(rating)::DECIMAL(3,2), 0.00)
-        FROM feedbacks
-        WHERE tutor_id = NEW.tutor_id
+    SET rating_sum = rating_sum + p_sign * p_rating,
+        rating_count = rating_count + p_sign
+    WHERE tutor_id = p_tutor_id;
+
+    INSERT INTO tutor_feedback_stats AS s (tutor_id, stars_1, stars_2, stars_3, stars_4, stars_5)
+    VALUES (
+        p_tutor_id,
+        p_sign * (p_rating = 1)::INTEGER,
+        p_sign * (p_rating = 2)::INTEGER,
+        p_sign * (p_rating = 3)::INTEGER,
+        p_sign * (p_rating = 4)::INTEGER,
+        p_sign * (p_rating = 5)::INTEGER
     )
-    WHERE tutor_id = NEW.tutor_id;
+    ON CONFLICT (tutor_id) DO UPDATE
+    SET stars_1 = s.stars_1 + EXCLUDED.stars_1,
+        stars_2 = s.stars_2 + EXCLUDED.stars_2,
+        stars_3 = s.stars_3 + EXCLUDED.stars_3,
+        stars_4 = s.stars_4 + EXCLUDED.stars_4,
+        stars_5 = s.stars_5 + EXCLUDED.stars_5;
+
+    -- Отзывы без даты (созданные до появления created_at) в дневную статистику не попадают
+    IF p_day IS NOT NULL THEN
+        INSERT INTO tutor_feedback_daily AS d (tutor_id, day, rating_sum, rating_count)
+        VALUES (p_tutor_id, p_day, p_sign * p_rating, p_sign)
+        ON CONFLICT (tutor_id, day) DO UPDATE
+        SET rating_sum = d.rating_sum + EXCLUDED.rating_sum,
+            rating_count = d.rating_count + EXCLUDED.rating_count;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Функция для автоматического обновления рейтинга и статистики отзывов репетитора:
+-- агрегаты меняются на дельту, без пересчёта по всем отзывам
+CREATE OR REPLACE FUNCTION update_tutor_rating_func()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.tutor_id IS NOT DISTINCT FROM NEW.tutor_id
+       AND OLD.rating IS NOT DISTINCT FROM NEW.rating THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.rating IS NOT NULL THEN
+            PERFORM apply_feedback_delta(OLD.tutor_id, OLD.rating, OLD.created_at::DATE, -1);
+        END IF;
+    END IF;
 
-    RETURN NEW;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.rating IS NOT NULL THEN
+            PERFORM apply_feedback_delta(NEW.tutor_id, NEW.rating, NEW.created_at::DATE, 1);
+        END IF;
+    END IF;
+
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
 -- Триггер для обновления рейтинга репетитора
 CREATE TRIGGER trg_update_tutor_rating
-AFTER INSERT OR DELETE OR UPDATE OF rating
+AFTER INSERT OR DELETE OR UPDATE OF rating, tutor_id
 ON feedbacks
 FOR EACH ROW
 EXECUTE PROCEDURE update_tutor_rating_func();
+
+-- Разовый пересчёт rating_sum/rating_count по таблице отзывов
+CREATE OR REPLACE FUNCTION backfill_tutor_ratings()
+RETURNS VOID AS $$
+BEGIN
+    UPDATE tutors AS t
+    SET rating_sum = f.rating_sum,
+        rating_count = f.rating_count
+    FROM (
+        SELECT tt.tutor_id,
+               COALESCE(SUM(fb.rating), 0) AS rating_sum,
+               COUNT(fb.rating) AS rating_count
+        FROM tutors AS tt
+        LEFT JOIN feedbacks AS fb ON fb.tutor_id = tt.tutor_id
+        GROUP BY tt.tutor_id
+    ) AS f
+    WHERE f.tutor_id = t.tutor_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Разовый пересчёт гистограммы и дневной статистики отзывов
+CREATE OR REPLACE FUNCTION backfill_tutor_feedback_stats()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM tutor_feedback_stats;
+    INSERT INTO tutor_feedback_stats (tutor_id, stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT tutor_id,
+           COUNT(*) FILTER (WHERE rating = 1),
+           COUNT(*) FILTER (WHERE rating = 2),
+           COUNT(*) FILTER (WHERE rating = 3),
+           COUNT(*) FILTER (WHERE rating = 4),
+           COUNT(*) FILTER (WHERE rating = 5)
+    FROM feedbacks
+    WHERE tutor_id IS NOT NULL AND rating IS NOT NULL
+    GROUP BY tutor_id;
+
+    DELETE FROM tutor_feedback_daily;
+    INSERT INTO tutor_feedback_daily (tutor_id, day, rating_sum, rating_count)
+    SELECT tutor_id, created_at::DATE, SUM(rating), COUNT(rating)
+    FROM feedbacks
+    WHERE tutor_id IS NOT NULL AND rating IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY tutor_id, created_at::DATE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Поисковый документ репетитора: имя, предметы и описание.
+-- Собирается из нескольких таблиц, поэтому хранится в tutors и обновляется триггерами
+CREATE OR REPLACE FUNCTION refresh_tutor_search(p_tutor_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE tutors AS t
+    SET search_text = lower(concat_ws(' ', u.first_name, u.last_name, s.names)),
+        search_vector =
+            setweight(to_tsvector('russian', concat_ws(' ', u.first_name, u.last_name)), 'A') ||
+            setweight(to_tsvector('russian', COALESCE(s.names, '')), 'B') ||
+            setweight(to_tsvector('russian', COALESCE(t.description, '')), 'C')
+    FROM users AS u,
+         LATERAL (
+             SELECT string_agg(sub.subject_name, ' ') AS names
+             FROM tutor_subjects AS ts
+             JOIN subjects AS sub ON sub.subject_id = ts.subject_id
+             WHERE ts.tutor_id = p_tutor_id
+         ) AS s
+    WHERE t.tutor_id = p_tutor_id
+      AND u.user_id = t.user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tutor_search_trigger_func()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'tutors' THEN
+        PERFORM refresh_tutor_search(NEW.tutor_id);
+    ELSIF TG_TABLE_NAME = 'users' THEN
+        PERFORM refresh_tutor_search(tutor_id) FROM tutors WHERE user_id = NEW.user_id;
+    ELSIF TG_TABLE_NAME = 'tutor_subjects' THEN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM refresh_tutor_search(OLD.tutor_id);
+        ELSE
+            PERFORM refresh_tutor_search(NEW.tutor_id);
+        END IF;
+    ELSIF TG_TABLE_NAME = 'subjects' THEN
+        PERFORM refresh_tutor_search(tutor_id) FROM tutor_subjects WHERE subject_id = NEW.subject_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_tutor_search_tutors
+AFTER INSERT OR UPDATE OF description, user_id
+ON tutors
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_users
+AFTER UPDATE OF first_name, last_name
+ON users
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_tutor_subjects
+AFTER INSERT OR DELETE
+ON tutor_subjects
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_subjects
+AFTER UPDATE OF subject_name
+ON subjects
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+-- Индексы под запросы из app/crud.py (см. migrations/)
+CREATE INDEX idx_lessons_tutor_page
+    ON lessons (tutor_id, lesson_date, lesson_time, lesson_id)
+    INCLUDE (student_id, subject_id, duration_minutes, status);
+
+CREATE INDEX idx_lessons_student_page
+    ON lessons (student_id, lesson_date, lesson_time, lesson_id)
+    INCLUDE (tutor_id, subject_id, duration_minutes, status);
+
+CREATE INDEX idx_feedbacks_tutor_page
+    ON feedbacks (tutor_id, feedback_id DESC)
+    INCLUDE (lesson_id, rating, created_at);
+
+CREATE INDEX idx_tutors_rating_id ON tutors (rating, tutor_id);
+
+CREATE INDEX idx_tutors_experience_id ON tutors (experience, tutor_id);
+
+CREATE INDEX idx_tutor_subjects_tutor ON tutor_subjects (tutor_id);
+
+CREATE INDEX idx_tutor_availability_slot
+    ON tutor_availability (tutor_id, weekday, start_time)
+    INCLUDE (end_time);
+
+CREATE INDEX idx_tutors_search_vector ON tutors USING gin (search_vector);
+
+CREATE INDEX idx_tutors_search_text_trgm ON tutors USING gin (search_text gin_trgm_ops);
+
+-- Рейтинг репетиторов: байесовская оценка (априорное среднее по всем отзывам с весом 10),
+-- число отзывов и завершённых занятий, общее место
+CREATE MATERIALIZED VIEW tutor_leaderboard AS
+WITH prior AS (
+    SELECT COALESCE(SUM(rating_sum)::DECIMAL / NULLIF(SUM(rating_count), 0), 0) AS mean_rating
+    FROM tutors
+),
+completed AS (
+    SELECT tutor_id, COUNT(*) AS completed_lessons
+    FROM lessons
+    WHERE status = 'completed'
+    GROUP BY tutor_id
+),
+scored AS (
+    SELECT t.tutor_id,
+           t.rating_count AS review_count,
+           COALESCE(c.completed_lessons, 0) AS completed_lessons,
+           ROUND((10 * p.mean_rating + t.rating_sum) / (10 + t.rating_count), 4) AS bayesian_rating
+    FROM tutors AS t
+    CROSS JOIN prior AS p
+    LEFT JOIN completed AS c ON c.tutor_id = t.tutor_id
+)
+SELECT tutor_id, review_count, completed_lessons, bayesian_rating,
+       RANK() OVER (ORDER BY bayesian_rating DESC, review_count DESC) AS overall_rank
+FROM scored;
+
+CREATE UNIQUE INDEX idx_tutor_leaderboard_tutor ON tutor_leaderboard (tutor_id);
+CREATE INDEX idx_tutor_leaderboard_rank ON tutor_leaderboard (overall_rank, tutor_id);
+
+-- То же в разрезе предметов: по занятиям и отзывам на занятия этого предмета
+CREATE MATERIALIZED VIEW tutor_subject_leaderboard AS
+WITH prior AS (
+    SELECT COALESCE(AVG(rating), 0) AS mean_rating
+    FROM feedbacks
+),
+per_subject AS (
+    SELECT l.tutor_id, l.subject_id,
+           COUNT(*) FILTER (WHERE l.status = 'completed') AS completed_lessons,
+           COUNT(f.feedback_id) AS review_count,
+           COALESCE(SUM(f.rating), 0) AS rating_sum
+    FROM lessons AS l
+    LEFT JOIN feedbacks AS f ON f.lesson_id = l.lesson_id
+    GROUP BY l.tutor_id, l.subject_id
+),
+scored AS (
+    SELECT s.subject_id, s.tutor_id, s.review_count, s.completed_lessons,
+           ROUND((10 * p.mean_rating + s.rating_sum) / (10 + s.review_count), 4) AS bayesian_rating
+    FROM per_subject AS s
+    CROSS JOIN prior AS p
+)
+SELECT subject_id, tutor_id, review_count, completed_lessons, bayesian_rating,
+       RANK() OVER (PARTITION BY subject_id ORDER BY bayesian_rating DESC, review_count DESC) AS subject_rank
+FROM scored;
+
+CREATE UNIQUE INDEX idx_tutor_subject_leaderboard_key ON tutor_subject_leaderboard (subject_id, tutor_id);
+CREATE INDEX idx_tutor_subject_leaderboard_rank ON tutor_subject_leaderboard (subject_id, subject_rank, tutor_id);
+
+-- Обновление рейтингов без блокировки чтения; advisory lock не даёт
+-- нескольким воркерам обновлять одновременно
+CREATE OR REPLACE FUNCTION refresh_tutor_leaderboards()
+RETURNS BOOLEAN AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('refresh_tutor_leaderboards')) THEN
+        RETURN FALSE;
+    END IF;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY tutor_leaderboard;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY tutor_subject_leaderboard;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Счётчики версий таблиц: версия увеличивается после каждой изменяющей команды,
+-- по ней приложение понимает, что закешированная копия устарела
+CREATE TABLE table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- clock_timestamp(), а не время начала транзакции: блокировка строки счётчика
+    -- упорядочивает обновления, и updated_at не уменьшается
+    INSERT INTO table_versions AS v (table_name, updated_at)
+    VALUES (TG_TABLE_NAME, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = v.version + 1,
+        updated_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_subjects_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON subjects
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_users_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_tutors_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tutors
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_students_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON students
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_lessons_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON lessons
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_feedbacks_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON feedbacks
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+INSERT INTO table_versions (table_name)
+VALUES ('subjects'), ('users'), ('tutors'), ('students'), ('lessons'), ('feedbacks');
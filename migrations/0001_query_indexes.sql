@@ -0,0 +1,29 @@
+-- 0001: индексы под запросы из app/crud.py
+-- Применение: psql -d <db> -f migrations/0001_query_indexes.sql
+-- CONCURRENTLY нельзя выполнять внутри транзакции, поэтому без BEGIN/COMMIT
+
+-- Расписание репетитора: WHERE tutor_id = ? ORDER BY lesson_date, lesson_time
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lessons_tutor_date_time
+    ON lessons (tutor_id, lesson_date, lesson_time)
+    INCLUDE (lesson_id, student_id, subject_id, status);
+
+-- Расписание ученика: WHERE student_id = ? ORDER BY lesson_date, lesson_time
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lessons_student_date_time
+    ON lessons (student_id, lesson_date, lesson_time)
+    INCLUDE (lesson_id, tutor_id, subject_id, status);
+
+-- Отзывы репетитора: WHERE tutor_id = ? ORDER BY feedback_id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_tutor_id
+    ON feedbacks (tutor_id, feedback_id DESC)
+    INCLUDE (lesson_id, rating);
+
+-- Проверка существующего пользователя по телефону
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_phone
+    ON users (phone);
+
+-- Keyset-пагинация списка репетиторов
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tutors_rating_id
+    ON tutors (rating, tutor_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tutors_experience_id
+    ON tutors (experience, tutor_id);
@@ -0,0 +1,80 @@
+-- 0002: инкрементальный рейтинг репетитора (rating_sum / rating_count)
+-- Применение: psql -d <db> -f migrations/0002_incremental_tutor_rating.sql
+BEGIN;
+
+ALTER TABLE tutors
+    ADD COLUMN rating_sum BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0;
+
+-- rating становится вычисляемым столбцом, индекс пересоздаётся
+DROP INDEX IF EXISTS idx_tutors_rating_id;
+ALTER TABLE tutors DROP COLUMN rating;
+ALTER TABLE tutors
+    ADD COLUMN rating DECIMAL(3, 2) GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN ROUND(rating_sum::DECIMAL / rating_count, 2) ELSE 0.00 END
+    ) STORED;
+CREATE INDEX idx_tutors_rating_id ON tutors (rating, tutor_id);
+
+-- Функция для автоматического обновления рейтинга репетитора:
+-- сумма и количество оценок меняются на дельту, без пересчёта AVG по всем отзывам
+CREATE OR REPLACE FUNCTION update_tutor_rating_func()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.tutor_id IS NOT DISTINCT FROM NEW.tutor_id
+       AND OLD.rating IS NOT DISTINCT FROM NEW.rating THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.rating IS NOT NULL THEN
+            UPDATE tutors
+            SET rating_sum = rating_sum - OLD.rating,
+                rating_count = rating_count - 1
+            WHERE tutor_id = OLD.tutor_id;
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.rating IS NOT NULL THEN
+            UPDATE tutors
+            SET rating_sum = rating_sum + NEW.rating,
+                rating_count = rating_count + 1
+            WHERE tutor_id = NEW.tutor_id;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер для обновления рейтинга репетитора
+DROP TRIGGER IF EXISTS trg_update_tutor_rating ON feedbacks;
+CREATE TRIGGER trg_update_tutor_rating
+AFTER INSERT OR DELETE OR UPDATE OF rating, tutor_id
+ON feedbacks
+FOR EACH ROW
+EXECUTE PROCEDURE update_tutor_rating_func();
+
+-- Разовый пересчёт rating_sum/rating_count по таблице отзывов
+CREATE OR REPLACE FUNCTION backfill_tutor_ratings()
+RETURNS VOID AS $$
+BEGIN
+    UPDATE tutors AS t
+    SET rating_sum = f.rating_sum,
+        rating_count = f.rating_count
+    FROM (
+        SELECT tt.tutor_id,
+               COALESCE(SUM(fb.rating), 0) AS rating_sum,
+               COUNT(fb.rating) AS rating_count
+        FROM tutors AS tt
+        LEFT JOIN feedbacks AS fb ON fb.tutor_id = tt.tutor_id
+        GROUP BY tt.tutor_id
+    ) AS f
+    WHERE f.tutor_id = t.tutor_id;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT backfill_tutor_ratings();
+
+COMMIT;
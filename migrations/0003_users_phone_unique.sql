@@ -0,0 +1,11 @@
+-- 0003: уникальность телефона пользователя
+-- Повторная регистрация с тем же телефоном теперь определяется по нарушению
+-- ограничения, а не предварительным SELECT. Перед применением убедитесь,
+-- что в users нет дублей phone.
+-- Применение: psql -d <db> -f migrations/0003_users_phone_unique.sql
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_phone_key ON users (phone);
+
+ALTER TABLE users ADD CONSTRAINT users_phone_key UNIQUE USING INDEX users_phone_key;
+
+-- Обычный индекс из 0001 больше не нужен
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_phone;
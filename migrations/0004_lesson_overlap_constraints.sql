@@ -0,0 +1,25 @@
+-- 0004: длительность занятия и запрет пересечений расписания
+-- Перед применением нужно разрешить уже существующие пересечения
+-- (например, отменить одно из занятий), иначе ограничения не создадутся.
+-- Применение: psql -d <db> -f migrations/0004_lesson_overlap_constraints.sql
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE lessons
+    ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 60 CHECK (duration_minutes > 0);
+
+ALTER TABLE lessons
+    ADD COLUMN lesson_period TSRANGE GENERATED ALWAYS AS (
+        tsrange(lesson_date + lesson_time, lesson_date + lesson_time + duration_minutes * INTERVAL '1 minute')
+    ) STORED;
+
+ALTER TABLE lessons
+    ADD CONSTRAINT lessons_tutor_no_overlap
+        EXCLUDE USING gist (tutor_id WITH =, lesson_period WITH &&) WHERE (status <> 'canceled');
+
+ALTER TABLE lessons
+    ADD CONSTRAINT lessons_student_no_overlap
+        EXCLUDE USING gist (student_id WITH =, lesson_period WITH &&) WHERE (status <> 'canceled');
+
+COMMIT;
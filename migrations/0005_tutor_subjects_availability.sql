@@ -0,0 +1,28 @@
+-- 0005: предметы репетиторов и слоты доступности для поиска свободных репетиторов
+-- Применение: psql -d <db> -f migrations/0005_tutor_subjects_availability.sql
+BEGIN;
+
+-- Предметы, которые ведёт репетитор
+CREATE TABLE tutor_subjects (
+    subject_id INTEGER REFERENCES subjects(subject_id) ON DELETE CASCADE,
+    tutor_id INTEGER REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, tutor_id)
+);
+
+-- Еженедельные слоты доступности репетитора (weekday: 0 - понедельник)
+CREATE TABLE tutor_availability (
+    availability_id SERIAL PRIMARY KEY,
+    tutor_id INTEGER NOT NULL REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    CHECK (start_time < end_time)
+);
+
+CREATE INDEX idx_tutor_subjects_tutor ON tutor_subjects (tutor_id);
+
+CREATE INDEX idx_tutor_availability_slot
+    ON tutor_availability (tutor_id, weekday, start_time)
+    INCLUDE (end_time);
+
+COMMIT;
@@ -0,0 +1,86 @@
+-- 0006: полнотекстовый и нечёткий поиск репетиторов
+-- Применение: psql -d <db> -f migrations/0006_tutor_full_text_search.sql
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE tutors
+    ADD COLUMN search_text TEXT,
+    ADD COLUMN search_vector TSVECTOR;
+
+-- Поисковый документ репетитора: имя, предметы и описание.
+-- Собирается из нескольких таблиц, поэтому хранится в tutors и обновляется триггерами
+CREATE OR REPLACE FUNCTION refresh_tutor_search(p_tutor_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE tutors AS t
+    SET search_text = lower(concat_ws(' ', u.first_name, u.last_name, s.names)),
+        search_vector =
+            setweight(to_tsvector('russian', concat_ws(' ', u.first_name, u.last_name)), 'A') ||
+            setweight(to_tsvector('russian', COALESCE(s.names, '')), 'B') ||
+            setweight(to_tsvector('russian', COALESCE(t.description, '')), 'C')
+    FROM users AS u,
+         LATERAL (
+             SELECT string_agg(sub.subject_name, ' ') AS names
+             FROM tutor_subjects AS ts
+             JOIN subjects AS sub ON sub.subject_id = ts.subject_id
+             WHERE ts.tutor_id = p_tutor_id
+         ) AS s
+    WHERE t.tutor_id = p_tutor_id
+      AND u.user_id = t.user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tutor_search_trigger_func()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'tutors' THEN
+        PERFORM refresh_tutor_search(NEW.tutor_id);
+    ELSIF TG_TABLE_NAME = 'users' THEN
+        PERFORM refresh_tutor_search(tutor_id) FROM tutors WHERE user_id = NEW.user_id;
+    ELSIF TG_TABLE_NAME = 'tutor_subjects' THEN
+        IF TG_OP = 'DELETE' THEN
+            PERFORM refresh_tutor_search(OLD.tutor_id);
+        ELSE
+            PERFORM refresh_tutor_search(NEW.tutor_id);
+        END IF;
+    ELSIF TG_TABLE_NAME = 'subjects' THEN
+        PERFORM refresh_tutor_search(tutor_id) FROM tutor_subjects WHERE subject_id = NEW.subject_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_tutor_search_tutors
+AFTER INSERT OR UPDATE OF description, user_id
+ON tutors
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_users
+AFTER UPDATE OF first_name, last_name
+ON users
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_tutor_subjects
+AFTER INSERT OR DELETE
+ON tutor_subjects
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+CREATE TRIGGER trg_tutor_search_subjects
+AFTER UPDATE OF subject_name
+ON subjects
+FOR EACH ROW
+EXECUTE PROCEDURE tutor_search_trigger_func();
+
+-- Заполнение для существующих репетиторов
+SELECT refresh_tutor_search(tutor_id) FROM tutors;
+
+CREATE INDEX idx_tutors_search_vector ON tutors USING gin (search_vector);
+
+CREATE INDEX idx_tutors_search_text_trgm ON tutors USING gin (search_text gin_trgm_ops);
+
+COMMIT;
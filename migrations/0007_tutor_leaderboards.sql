@@ -0,0 +1,76 @@
+-- 0007: материализованные рейтинги репетиторов
+-- Применение: psql -d <db> -f migrations/0007_tutor_leaderboards.sql
+BEGIN;
+
+-- Рейтинг репетиторов: байесовская оценка (априорное среднее по всем отзывам с весом 10),
+-- число отзывов и завершённых занятий, общее место
+CREATE MATERIALIZED VIEW tutor_leaderboard AS
+WITH prior AS (
+    SELECT COALESCE(SUM(rating_sum)::DECIMAL / NULLIF(SUM(rating_count), 0), 0) AS mean_rating
+    FROM tutors
+),
+completed AS (
+    SELECT tutor_id, COUNT(*) AS completed_lessons
+    FROM lessons
+    WHERE status = 'completed'
+    GROUP BY tutor_id
+),
+scored AS (
+    SELECT t.tutor_id,
+           t.rating_count AS review_count,
+           COALESCE(c.completed_lessons, 0) AS completed_lessons,
+           ROUND((10 * p.mean_rating + t.rating_sum) / (10 + t.rating_count), 4) AS bayesian_rating
+    FROM tutors AS t
+    CROSS JOIN prior AS p
+    LEFT JOIN completed AS c ON c.tutor_id = t.tutor_id
+)
+SELECT tutor_id, review_count, completed_lessons, bayesian_rating,
+       RANK() OVER (ORDER BY bayesian_rating DESC, review_count DESC) AS overall_rank
+FROM scored;
+
+CREATE UNIQUE INDEX idx_tutor_leaderboard_tutor ON tutor_leaderboard (tutor_id);
+CREATE INDEX idx_tutor_leaderboard_rank ON tutor_leaderboard (overall_rank, tutor_id);
+
+-- То же в разрезе предметов: по занятиям и отзывам на занятия этого предмета
+CREATE MATERIALIZED VIEW tutor_subject_leaderboard AS
+WITH prior AS (
+    SELECT COALESCE(AVG(rating), 0) AS mean_rating
+    FROM feedbacks
+),
+per_subject AS (
+    SELECT l.tutor_id, l.subject_id,
+           COUNT(*) FILTER (WHERE l.status = 'completed') AS completed_lessons,
+           COUNT(f.feedback_id) AS review_count,
+           COALESCE(SUM(f.rating), 0) AS rating_sum
+    FROM lessons AS l
+    LEFT JOIN feedbacks AS f ON f.lesson_id = l.lesson_id
+    GROUP BY l.tutor_id, l.subject_id
+),
+scored AS (
+    SELECT s.subject_id, s.tutor_id, s.review_count, s.completed_lessons,
+           ROUND((10 * p.mean_rating + s.rating_sum) / (10 + s.review_count), 4) AS bayesian_rating
+    FROM per_subject AS s
+    CROSS JOIN prior AS p
+)
+SELECT subject_id, tutor_id, review_count, completed_lessons, bayesian_rating,
+       RANK() OVER (PARTITION BY subject_id ORDER BY bayesian_rating DESC, review_count DESC) AS subject_rank
+FROM scored;
+
+CREATE UNIQUE INDEX idx_tutor_subject_leaderboard_key ON tutor_subject_leaderboard (subject_id, tutor_id);
+CREATE INDEX idx_tutor_subject_leaderboard_rank ON tutor_subject_leaderboard (subject_id, subject_rank, tutor_id);
+
+-- Обновление рейтингов без блокировки чтения; advisory lock не даёт
+-- нескольким воркерам обновлять одновременно
+CREATE OR REPLACE FUNCTION refresh_tutor_leaderboards()
+RETURNS BOOLEAN AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('refresh_tutor_leaderboards')) THEN
+        RETURN FALSE;
+    END IF;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY tutor_leaderboard;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY tutor_subject_leaderboard;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,118 @@
+-- 0008: статистика отзывов репетитора (гистограмма оценок, среднее за 30 дней)
+-- Применение: psql -d <db> -f migrations/0008_tutor_feedback_stats.sql
+BEGIN;
+
+-- Существующие отзывы остаются без даты: их время создания неизвестно
+ALTER TABLE feedbacks ADD COLUMN created_at TIMESTAMP;
+ALTER TABLE feedbacks ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP;
+
+-- Распределение оценок репетитора, поддерживается триггером на feedbacks
+CREATE TABLE tutor_feedback_stats (
+    tutor_id INTEGER PRIMARY KEY REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    stars_1 INTEGER NOT NULL DEFAULT 0,
+    stars_2 INTEGER NOT NULL DEFAULT 0,
+    stars_3 INTEGER NOT NULL DEFAULT 0,
+    stars_4 INTEGER NOT NULL DEFAULT 0,
+    stars_5 INTEGER NOT NULL DEFAULT 0
+);
+
+-- Сумма и количество оценок по дням: среднее за 30 дней читается не более чем из 30 строк
+CREATE TABLE tutor_feedback_daily (
+    tutor_id INTEGER REFERENCES tutors(tutor_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tutor_id, day)
+);
+
+-- Применение одного отзыва к агрегатам репетитора с знаком +1 (добавление) или -1 (удаление)
+CREATE OR REPLACE FUNCTION apply_feedback_delta(p_tutor_id INTEGER, p_rating INTEGER, p_day DATE, p_sign INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE tutors
+    SET rating_sum = rating_sum + p_sign * p_rating,
+        rating_count = rating_count + p_sign
+    WHERE tutor_id = p_tutor_id;
+
+    INSERT INTO tutor_feedback_stats AS s (tutor_id, stars_1, stars_2, stars_3, stars_4, stars_5)
+    VALUES (
+        p_tutor_id,
+        p_sign * (p_rating = 1)::INTEGER,
+        p_sign * (p_rating = 2)::INTEGER,
+        p_sign * (p_rating = 3)::INTEGER,
+        p_sign * (p_rating = 4)::INTEGER,
+        p_sign * (p_rating = 5)::INTEGER
+    )
+    ON CONFLICT (tutor_id) DO UPDATE
+    SET stars_1 = s.stars_1 + EXCLUDED.stars_1,
+        stars_2 = s.stars_2 + EXCLUDED.stars_2,
+        stars_3 = s.stars_3 + EXCLUDED.stars_3,
+        stars_4 = s.stars_4 + EXCLUDED.stars_4,
+        stars_5 = s.stars_5 + EXCLUDED.stars_5;
+
+    -- Отзывы без даты (созданные до появления created_at) в дневную статистику не попадают
+    IF p_day IS NOT NULL THEN
+        INSERT INTO tutor_feedback_daily AS d (tutor_id, day, rating_sum, rating_count)
+        VALUES (p_tutor_id, p_day, p_sign * p_rating, p_sign)
+        ON CONFLICT (tutor_id, day) DO UPDATE
+        SET rating_sum = d.rating_sum + EXCLUDED.rating_sum,
+            rating_count = d.rating_count + EXCLUDED.rating_count;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Функция для автоматического обновления рейтинга и статистики отзывов репетитора:
+-- агрегаты меняются на дельту, без пересчёта по всем отзывам
+CREATE OR REPLACE FUNCTION update_tutor_rating_func()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.tutor_id IS NOT DISTINCT FROM NEW.tutor_id
+       AND OLD.rating IS NOT DISTINCT FROM NEW.rating THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.rating IS NOT NULL THEN
+            PERFORM apply_feedback_delta(OLD.tutor_id, OLD.rating, OLD.created_at::DATE, -1);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.rating IS NOT NULL THEN
+            PERFORM apply_feedback_delta(NEW.tutor_id, NEW.rating, NEW.created_at::DATE, 1);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Разовый пересчёт гистограммы и дневной статистики отзывов
+CREATE OR REPLACE FUNCTION backfill_tutor_feedback_stats()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM tutor_feedback_stats;
+    INSERT INTO tutor_feedback_stats (tutor_id, stars_1, stars_2, stars_3, stars_4, stars_5)
+    SELECT tutor_id,
+           COUNT(*) FILTER (WHERE rating = 1),
+           COUNT(*) FILTER (WHERE rating = 2),
+           COUNT(*) FILTER (WHERE rating = 3),
+           COUNT(*) FILTER (WHERE rating = 4),
+           COUNT(*) FILTER (WHERE rating = 5)
+    FROM feedbacks
+    WHERE tutor_id IS NOT NULL AND rating IS NOT NULL
+    GROUP BY tutor_id;
+
+    DELETE FROM tutor_feedback_daily;
+    INSERT INTO tutor_feedback_daily (tutor_id, day, rating_sum, rating_count)
+    SELECT tutor_id, created_at::DATE, SUM(rating), COUNT(rating)
+    FROM feedbacks
+    WHERE tutor_id IS NOT NULL AND rating IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY tutor_id, created_at::DATE;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT backfill_tutor_feedback_stats();
+
+COMMIT;
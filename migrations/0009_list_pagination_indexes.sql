@@ -0,0 +1,19 @@
+-- 0009: индексы под keyset-пагинацию списков занятий и отзывов
+-- lesson_id становится ключевым столбцом, чтобы условие
+-- (lesson_date, lesson_time, lesson_id) > (...) обслуживалось индексом
+-- Применение: psql -d <db> -f migrations/0009_list_pagination_indexes.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lessons_tutor_page
+    ON lessons (tutor_id, lesson_date, lesson_time, lesson_id)
+    INCLUDE (student_id, subject_id, duration_minutes, status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lessons_student_page
+    ON lessons (student_id, lesson_date, lesson_time, lesson_id)
+    INCLUDE (tutor_id, subject_id, duration_minutes, status);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_feedbacks_tutor_page
+    ON feedbacks (tutor_id, feedback_id DESC)
+    INCLUDE (lesson_id, rating, created_at);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_lessons_tutor_date_time;
+DROP INDEX CONCURRENTLY IF EXISTS idx_lessons_student_date_time;
+DROP INDEX CONCURRENTLY IF EXISTS idx_feedbacks_tutor_id;
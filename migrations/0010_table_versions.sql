@@ -0,0 +1,34 @@
+-- 0010: счётчики версий таблиц для кеширования справочников
+-- Применение: psql -d <db> -f migrations/0010_table_versions.sql
+BEGIN;
+
+-- Версия увеличивается после каждой изменяющей команды над таблицей;
+-- по ней приложение понимает, что закешированная копия устарела
+CREATE TABLE table_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- clock_timestamp(), а не время начала транзакции: блокировка строки счётчика
+    -- упорядочивает обновления, и updated_at не уменьшается
+    INSERT INTO table_versions AS v (table_name, updated_at)
+    VALUES (TG_TABLE_NAME, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = v.version + 1,
+        updated_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер уровня команды: одно обновление счётчика на INSERT/UPDATE/DELETE, а не на строку
+CREATE TRIGGER trg_subjects_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON subjects
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+INSERT INTO table_versions (table_name) VALUES ('subjects');
+
+COMMIT;
@@ -0,0 +1,43 @@
+-- 0011: счётчики версий для таблиц, которые читают эндпоинты с условными GET (ETag)
+-- Применение: psql -d <db> -f migrations/0011_read_endpoint_versions.sql
+BEGIN;
+
+-- Время изменения берётся в момент обновления счётчика (clock_timestamp()), а не
+-- в начале транзакции: иначе транзакция, ждавшая блокировку, сдвигала бы его назад
+CREATE OR REPLACE FUNCTION bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO table_versions AS v (table_name, updated_at)
+    VALUES (TG_TABLE_NAME, clock_timestamp())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = v.version + 1,
+        updated_at = clock_timestamp();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_users_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_tutors_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tutors
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_students_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON students
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_lessons_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON lessons
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER trg_feedbacks_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON feedbacks
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+INSERT INTO table_versions (table_name)
+VALUES ('users'), ('tutors'), ('students'), ('lessons'), ('feedbacks')
+ON CONFLICT (table_name) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,52 @@
+# Стоимость опроса эндпоинта чтения: полные ответы против условных GET (If-None-Match).
+# Запускать против поднятого сервера с применённой миграцией 0011.
+#
+#   python scripts/bench_conditional_get.py --path /lessons/tutor/1 --requests 500
+import argparse
+import statistics
+import time
+
+import httpx
+
+
+def poll(client, path, count, etag=None):
+    latencies = []
+    statuses = {}
+    received = 0
+    for _ in range(count):
+        headers = {"If-None-Match": etag} if etag else {}
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        received += len(response.content)
+    return latencies, statuses, received
+
+
+def report(name, latencies, statuses, received):
+    print(
+        f"{name:12} statuses={statuses} "
+        f"p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"max={max(latencies) * 1000:.2f}ms "
+        f"body={received / len(latencies):.0f} B/request"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/tutors/")
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with httpx.Client(base_url=args.url, timeout=30) as client:
+        etag = client.get(args.path).headers.get("ETag")
+        if etag is None:
+            print("Сервер не вернул ETag: проверьте миграцию 0011 и CONDITIONAL_GET_ENABLED")
+            return
+        report("full", *poll(client, args.path, args.requests))
+        report("conditional", *poll(client, args.path, args.requests, etag))
+
+
+if __name__ == "__main__":
+    main()
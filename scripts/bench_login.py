@@ -0,0 +1,73 @@
+# Нагрузочный тест входа: "шторм" запросов /token и параллельно задержка
+# не связанного с bcrypt эндпоинта. Запускать против поднятого сервера
+# до и после изменения и сравнивать вывод.
+#
+#   python scripts/bench_login.py --email admin@example.com --password <пароль>
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def login_storm(client, args, stop_at, results):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.post("/token", data={"username": args.email, "password": args.password})
+        results.append((response.status_code, time.perf_counter() - started))
+
+
+async def probe(client, args, stop_at, latencies):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await client.get(args.probe_path)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(args.probe_interval)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", default="admin@example.com")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--probe-path", default="/subjects/1")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        stop_at = time.perf_counter() + args.duration
+        logins = []
+        probes = []
+        await asyncio.gather(
+            probe(client, args, stop_at, probes),
+            *(login_storm(client, args, stop_at, logins) for _ in range(args.concurrency)),
+        )
+
+    ok = [latency for status, latency in logins if status == 200]
+    rejected = sum(1 for status, _ in logins if status == 503)
+    print(f"logins: {len(ok)} ok, {rejected} rejected (503), {len(ok) / args.duration:.1f} req/s")
+    if ok:
+        print(f"login latency: p50={statistics.median(ok) * 1000:.0f}ms p95={percentile(ok, 95) * 1000:.0f}ms")
+    if not probes:
+        return
+    print(
+        f"{args.probe_path} latency during storm: "
+        f"p50={statistics.median(probes) * 1000:.1f}ms "
+        f"p95={percentile(probes, 95) * 1000:.1f}ms "
+        f"max={max(probes) * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
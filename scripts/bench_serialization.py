@@ -0,0 +1,62 @@
+# Сравнение сериализации ответа из 1000 занятий:
+#   до   - валидация каждого элемента через LessonOut + jsonable_encoder + json.dumps
+#   после - готовые строки из crud сразу в orjson (FAST_LIST_RESPONSES)
+#
+#   python scripts/bench_serialization.py --rows 1000 --repeat 200
+import argparse
+import json
+import sys
+import timeit
+from datetime import date, time, timedelta
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import schemas  # noqa: E402
+
+
+def make_lessons(count):
+    start = date(2024, 1, 1)
+    return [
+        {
+            "lesson_id": i,
+            "tutor_id": 1 + i % 50,
+            "student_id": 1 + i % 400,
+            "subject_id": 1 + i % 3,
+            "lesson_date": start + timedelta(days=i % 365),
+            "lesson_time": time(8 + i % 12, 0),
+            "duration_minutes": 60,
+            "status": "scheduled",
+        }
+        for i in range(count)
+    ]
+
+
+def validated_stdlib(rows):
+    models = [schemas.LessonOut(**row) for row in rows]
+    return json.dumps(jsonable_encoder(models)).encode()
+
+
+def trusted_orjson(rows):
+    return orjson.dumps(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_lessons(args.rows)
+    assert json.loads(validated_stdlib(rows)) == json.loads(trusted_orjson(rows))
+
+    for name, func in (("validated + json", validated_stdlib), ("trusted + orjson", trusted_orjson)):
+        seconds = timeit.timeit(lambda: func(rows), number=args.repeat)
+        print(f"{name:18} {seconds / args.repeat * 1000:8.2f} ms/response  {args.repeat / seconds:8.1f} responses/s")
+
+
+if __name__ == "__main__":
+    main()